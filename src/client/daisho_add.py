@@ -27,6 +27,7 @@ This module deals with adding notes and tasks,
 as well as editing them later.
 """
 
+import datetime
 import logging
 import os
 import pprint
@@ -34,8 +35,10 @@ import pprint
 from prompt_toolkit import prompt
 from prompt_toolkit.completion import WordCompleter
 from prompt_toolkit.history import FileHistory
+from prompt_toolkit.validation import Validator
 
 from client import daisho_db
+from db import recur
 
 logger = logging.getLogger(__name__)
 HOME = os.getenv("HOME")
@@ -43,6 +46,21 @@ DAISHO_HOME = HOME + "/.config/daisho/"
 ADD_HISTORY = DAISHO_HOME + "add_cmd.txt"
 
 
+def _valid_rule(rule):
+    try:
+        return not rule or bool(recur.parse(rule))
+    except ValueError:
+        return False
+
+
+# `Repeat` is blank, or a rule recur.parse() accepts.
+REPEAT_VALIDATOR = Validator.from_callable(
+    _valid_rule,
+    error_message="daily, weekly, monthly, yearly, every N days/weeks/months, "
+    "or `min hour day month weekday`",
+)
+
+
 def add_prompt(job_type=None):
     """
     `add` accepts the following arguments.
@@ -52,16 +70,35 @@ def add_prompt(job_type=None):
     Example:
         ->> add task # To add a task to Daisho.
         ->> add note # To add a note to Daisho.
+
+    A task's `Repeat` makes it recur; a recurring task with
+    no date starts today.
+
+    Returns the added task or note.
     """
     if job_type == "task":
-        task_fields = {"Subject": "", "Date": "", "Tags": [], "Priority": ""}
+        task_fields = {
+            "Subject": "",
+            "Date": "",
+            "Tags": [],
+            "Priority": "",
+            "Repeat": "",
+        }
         print(" - Creating a task.\n")
         for key in task_fields:
             task_fields[key] = prompt(
-                "{:>10} : ".format(key), history=FileHistory(ADD_HISTORY)
+                "{:>10} : ".format(key),
+                history=FileHistory(ADD_HISTORY),
+                validator=REPEAT_VALIDATOR if key == "Repeat" else None,
+            )
+        if task_fields["Repeat"] and not task_fields["Date"]:
+            task_fields["Date"] = datetime.date.today().strftime(
+                recur.DATE_FORMAT
             )
         print()
-        daisho_db.add_task(task_fields)
+        task_id = daisho_db.add_task(task_fields)
+        print("\nTask added!")
+        return dict(daisho_db.to_fields(task_fields), type="task", id=task_id)
 
     elif job_type == "note":
         note_fields = {
@@ -77,7 +114,9 @@ def add_prompt(job_type=None):
                 "{:>10} : ".format(key), history=FileHistory(ADD_HISTORY)
             )
         print()
-        daisho_db.add_note(note_fields)
+        note_id = daisho_db.add_note(note_fields)
+        print("\nNote added!")
+        return dict(daisho_db.to_fields(note_fields), type="note", id=note_id)
     # Process the dict `fields` before sending to
     # mongodb via add_data()
     else:
@@ -103,5 +142,28 @@ def add_note(note_dict):
     print("Adding your note to the database!")
 
 
-def edit_prompt(job_type=None, element_number=None):
-    pass
+def edit_prompt(item):
+    """
+    Prompt for each field of `item`, a task or note, with its current
+    value filled in, and save the fields that were changed.
+
+    Returns the edited task or note.
+    """
+    fields = ["Subject", "Date", "Tags", "Priority"]
+    fields.append("Repeat" if item["type"] == "task" else "Note")
+    print(" - Editing a {}.\n".format(item["type"]))
+    edited = {}
+    for key in fields:
+        value = item.get(key.lower()) or ""
+        if key == "Tags":
+            value = " ".join(value)
+        edited[key] = prompt(
+            "{:>10} : ".format(key),
+            default=value,
+            history=FileHistory(ADD_HISTORY),
+            validator=REPEAT_VALIDATOR if key == "Repeat" else None,
+        )
+    print()
+    item = daisho_db.edit_item(item, edited)
+    print("\n{} saved, revision {}".format(item["type"].title(), item.get("rev", 0)))
+    return item
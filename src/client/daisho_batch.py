@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+# MIT License
+
+# Copyright (C) 2018 Vimal A.R <arvimal@yahoo.in>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Non-interactive commands, for scripts and cron jobs.
+
+    daisho add task --subject "Pay rent" --date 01-11-2026 --tags home
+    daisho add task --subject "Water plants" --repeat "every 3 days"
+    daisho list today --json
+    daisho list prio high
+    daisho next 10
+    daisho find rent
+    daisho -f commands.txt
+
+With `-f`, each line of the file is one command (without the leading
+`daisho`), and all of them run in the same process, over the same
+connection. Blank lines and lines starting with `#` are skipped.
+
+Listings are printed one item per line, tab separated, or as JSON
+(one object per line) with `--json`. Errors are printed to stderr.
+"""
+
+import argparse
+import json
+import shlex
+import sys
+
+import pymongo
+
+from client import daisho_db
+from client import daisho_graphql
+from client import daisho_list
+from client import daisho_search
+from db import recur
+
+
+class CommandError(Exception):
+    pass
+
+
+# Errors that fail one command, but not the commands after it:
+# bad values, and the errors of the Daisho server or MongoDB.
+FAILURES = (ValueError, daisho_graphql.GraphQLError, pymongo.errors.PyMongoError)
+
+
+class _Parser(argparse.ArgumentParser):
+    # Raise instead of exiting, so a bad line in a script
+    # does not stop the lines after it.
+    def error(self, message):
+        raise CommandError(message)
+
+
+def repeat_rule(text):
+    """
+    `--repeat`'s type: an empty string, or a valid recurrence rule.
+    """
+    if text:
+        try:
+            recur.parse(text)
+        except ValueError as err:
+            raise argparse.ArgumentTypeError(str(err))
+    return text
+
+
+def build_parser():
+    parser = _Parser(prog="daisho", description="Daisho - A CLI todo manager")
+    parser.add_argument(
+        "-f", "--file", help="run the commands in FILE, one per line ('-' for stdin)"
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON output")
+
+    # `--json` may also follow the command; don't let the subcommand's
+    # default override a `--json` given before it.
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--json", action="store_true", default=argparse.SUPPRESS)
+
+    commands = parser.add_subparsers(dest="command", parser_class=_Parser)
+
+    add = commands.add_parser("add", parents=[output], help="add a task or note")
+    add.add_argument("job_type", choices=["task", "note"])
+    add.add_argument("--subject", required=True)
+    add.add_argument("--date", default="")
+    add.add_argument("--tags", default="")
+    add.add_argument("--priority", default="")
+    add.add_argument(
+        "--repeat",
+        default="",
+        type=repeat_rule,
+        help="make a task recur: daily, weekly, monthly, yearly, "
+        "every N days|weeks|months|years, or a cron expression",
+    )
+    add.add_argument("--note", default="", help="the note's text")
+
+    lister = commands.add_parser("list", parents=[output], help="list tasks and notes")
+    lister.add_argument(
+        "criteria",
+        nargs="?",
+        default="all",
+        choices=["all", "today", "tomorrow", "date", "tags", "prio", "trash"],
+    )
+    lister.add_argument("value", nargs="?", help="the date, tag or priority")
+
+    upcoming = commands.add_parser(
+        "next", parents=[output], help="list the most urgent tasks"
+    )
+    upcoming.add_argument("count", nargs="?", type=int, default=daisho_list.NEXT_K)
+
+    find = commands.add_parser("find", parents=[output], help="search for a keyword")
+    find.add_argument("keyword")
+    return parser
+
+
+def run_command(args, out=sys.stdout):
+    """
+    Run one parsed command, and print its result to `out`.
+    """
+    if args.command == "add":
+        fields = {
+            "Subject": args.subject,
+            "Date": args.date,
+            "Tags": args.tags,
+            "Priority": args.priority,
+        }
+        if args.job_type == "task":
+            fields["Repeat"] = args.repeat
+            job_id = daisho_db.add_task(fields)
+        else:
+            fields["Note"] = args.note
+            job_id = daisho_db.add_note(fields)
+        if args.json:
+            print(json.dumps({"added": args.job_type, "id": job_id}), file=out)
+        else:
+            print("{}\t{}".format(args.job_type, job_id), file=out)
+        return
+
+    if args.command == "list":
+        if args.criteria in ("date", "tags") and not args.value:
+            raise CommandError("`list {}` needs a value".format(args.criteria))
+        items = daisho_list.list_all(args.criteria, args.value)
+    elif args.command == "next":
+        items = daisho_list.next_tasks(args.count)
+    elif args.command == "find":
+        items = daisho_search.search(args.keyword)
+    else:
+        raise CommandError("a command is required")
+
+    for item in items:
+        if args.json:
+            print(json.dumps(item, default=str), file=out)
+        else:
+            print(daisho_list.format_item(item), file=out)
+
+
+def run_script(lines, parser, json_output=False):
+    """
+    Run each command in `lines`. Returns the number of failed commands.
+    """
+    failed = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            args = parser.parse_args(shlex.split(line))
+            if args.file:
+                raise CommandError("`-f` can not be used inside a script")
+            args.json = args.json or json_output
+            run_command(args)
+        except (CommandError,) + FAILURES as err:
+            failed += 1
+            print("line {}: {}".format(number, err), file=sys.stderr)
+    return failed
+
+
+def main(argv, connect):
+    """
+    Run the command in `argv`, or the script given with `-f`.
+    `connect` is called once the arguments are known to be valid.
+    Returns the process exit status.
+    """
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except CommandError as err:
+        parser.print_usage(sys.stderr)
+        print("daisho: error: {}".format(err), file=sys.stderr)
+        return 2
+
+    connect()
+    if args.file:
+        if args.file == "-":
+            return 1 if run_script(sys.stdin, parser, args.json) else 0
+        try:
+            script = open(args.file)
+        except OSError as err:
+            print("daisho: error: {}".format(err), file=sys.stderr)
+            return 2
+        with script:
+            return 1 if run_script(script, parser, args.json) else 0
+
+    try:
+        run_command(args)
+    except CommandError as err:
+        print("daisho: error: {}".format(err), file=sys.stderr)
+        return 2
+    except FAILURES as err:
+        print("daisho: error: {}".format(err), file=sys.stderr)
+        return 1
+    return 0
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+
+# MIT License
+
+# Copyright (C) 2018 Vimal A.R <arvimal@yahoo.in>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Context aware completion for the Daisho prompt.
+
+Besides the commands, this completes their arguments: `task` / `note`,
+the `list` filters, tags, priorities, keywords for `find`, and item
+numbers for `edit`, `open` and `del` (matched on the number, or on the
+item's subject).
+
+Everything is completed from `CompletionIndex`, which is loaded once
+when the REPL starts and then updated as items are added, so no
+keystroke ever queries the db. Words are looked up by prefix in a trie
+first, then by fuzzy (subsequence) match, where a per-character index
+narrows down the candidates before they are checked.
+"""
+
+from prompt_toolkit.completion import Completer, Completion
+
+LIMIT = 50
+
+COMMANDS = [
+    "add",
+    "del",
+    "list",
+    "next",
+    "find",
+    "edit",
+    "open",
+    "done",
+    "profile",
+    "help",
+    "quit",
+]
+SUBCOMMANDS = {
+    "add": ["task", "note"],
+    "del": ["task", "note"],
+    "edit": ["task", "note"],
+    "open": ["task", "note"],
+    "done": ["task"],
+    "list": ["all", "today", "tomorrow", "date", "tags", "prio", "trash"],
+    "profile": ["on", "off"],
+}
+PRIORITIES = ["#high", "#med", "#low"]
+
+
+class Trie(object):
+    """
+    Lower cased keys, for prefix lookups.
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, key):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def remove(self, key):
+        path = [self.root]
+        for char in key:
+            if char not in path[-1]:
+                return
+            path.append(path[-1][char])
+        path[-1].pop("", None)
+        # Prune the nodes left empty.
+        for depth in range(len(key), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][key[depth - 1]]
+
+    def prefix(self, text, limit=LIMIT):
+        """
+        Yield up to `limit` keys starting with `text`, in order.
+        """
+        node = self.root
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                return
+        # Depth first, so each key costs at most its length to reach.
+        stack = [(text, node)]
+        count = 0
+        while stack:
+            key, node = stack.pop()
+            if "" in node:
+                yield key
+                count += 1
+                if count >= limit:
+                    return
+            for char in sorted(node, reverse=True):
+                if char:
+                    stack.append((key + char, node[char]))
+
+
+class FuzzyIndex(object):
+    """
+    Maps keys to sets of values, with prefix and fuzzy key lookups.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.names = {}
+        self.trie = Trie()
+        self.chars = {}
+
+    def add(self, name, value=None):
+        key = name.lower()
+        if key not in self.values:
+            self.values[key] = set()
+            self.names[key] = name
+            self.trie.add(key)
+            for char in set(key):
+                self.chars.setdefault(char, set()).add(key)
+        self.values[key].add(value)
+
+    def remove(self, name, value=None):
+        key = name.lower()
+        values = self.values.get(key)
+        if values is None:
+            return
+        values.discard(value)
+        if values:
+            return
+        del self.values[key]
+        del self.names[key]
+        self.trie.remove(key)
+        for char in set(key):
+            self.chars[char].discard(key)
+
+    def search(self, text, limit=LIMIT):
+        """
+        Return up to `limit` (name, values) pairs: the prefix matches
+        of `text`, then the closest fuzzy matches.
+        """
+        text = text.lower()
+        found = list(self.trie.prefix(text, limit))
+        if len(found) < limit and text:
+            seen = set(found)
+            fuzzy = [key for key in self.fuzzy(text, limit * 4) if key not in seen]
+            fuzzy.sort(key=lambda key: (_spread(text, key), len(key)))
+            found.extend(fuzzy[: limit - len(found)])
+        return [(self.names[key], self.values[key]) for key in found]
+
+    def fuzzy(self, text, limit):
+        """
+        Yield up to `limit` keys that contain the characters
+        of `text`, in order.
+        """
+        sets = []
+        for char in set(text):
+            keys = self.chars.get(char)
+            if not keys:
+                return
+            sets.append(keys)
+        sets.sort(key=len)
+        count = 0
+        for key in sets[0]:
+            if all(key in keys for keys in sets[1:]) and _is_subsequence(text, key):
+                yield key
+                count += 1
+                if count >= limit:
+                    return
+
+
+class CompletionIndex(object):
+    """
+    The tags and subject words of every task and note.
+    Tasks and notes are numbered from 1, in the order they were added.
+    """
+
+    def __init__(self):
+        self.words = FuzzyIndex()
+        self.tags = FuzzyIndex()
+        self.items = {"task": {}, "note": {}}
+        self.order = {"task": [], "note": []}
+        self.numbers = {"task": {}, "note": {}}
+
+    def load(self, items):
+        for item in items:
+            self.add_item(item)
+
+    def add_item(self, item):
+        job_type, item_id = item["type"], item["id"]
+        if item_id in self.items[job_type]:
+            self._unindex(self.items[job_type][item_id])
+        else:
+            self.order[job_type].append(item_id)
+            self.numbers[job_type][item_id] = len(self.order[job_type])
+        self.items[job_type][item_id] = item
+        for word in (item.get("subject") or "").split():
+            self.words.add(word, item_id)
+        for tag in item.get("tags") or []:
+            self.tags.add(tag, item_id)
+            self.words.add(tag, item_id)
+
+    def item(self, job_type, number):
+        """
+        The task or note numbered `number`, or None.
+        """
+        order = self.order[job_type]
+        if not 1 <= number <= len(order):
+            return None
+        return self.items[job_type][order[number - 1]]
+
+    def remove_item(self, job_type, item_id):
+        item = self.items[job_type].pop(item_id, None)
+        if item is None:
+            return
+        self._unindex(item)
+        position = self.numbers[job_type].pop(item_id) - 1
+        order = self.order[job_type]
+        del order[position]
+        for number, other in enumerate(order[position:], position + 1):
+            self.numbers[job_type][other] = number
+
+    def _unindex(self, item):
+        item_id = item["id"]
+        for word in (item.get("subject") or "").split():
+            self.words.remove(word, item_id)
+        for tag in item.get("tags") or []:
+            self.tags.remove(tag, item_id)
+            self.words.remove(tag, item_id)
+
+    def number_matches(self, job_type, text, limit=LIMIT):
+        """
+        (number, subject) pairs for the items whose number starts
+        with `text`, or with a word in the subject matching it.
+        """
+        order, items = self.order[job_type], self.items[job_type]
+        if not text.isdigit():
+            matches = []
+            for word, item_ids in self.words.search(text, limit):
+                for item_id in item_ids:
+                    if item_id in items and len(matches) < limit:
+                        subject = items[item_id].get("subject") or ""
+                        matches.append((self.numbers[job_type][item_id], subject))
+            return matches
+
+        # Numbers are 1..len(order), so those starting with `text` are
+        # `text` itself, then text0..text9, text00..text99, and so on.
+        matches = []
+        if text.startswith("0"):
+            return matches
+        low = high = int(text)
+        while low <= len(order) and len(matches) < limit:
+            for number in range(max(low, 1), min(high, len(order)) + 1):
+                subject = items[order[number - 1]].get("subject") or ""
+                matches.append((number, subject))
+                if len(matches) >= limit:
+                    break
+            low, high = low * 10, high * 10 + 9
+        return matches
+
+
+class DaishoCompleter(Completer):
+    def __init__(self, index, commands=COMMANDS):
+        self.index = index
+        self.commands = commands
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor
+        words = text.split()
+        # The word being completed, and the complete words before it.
+        if text and not text[-1].isspace():
+            current, words = words[-1], words[:-1]
+        else:
+            current = ""
+        start = -len(current)
+
+        if not words:
+            for command in _match_list(self.commands, current):
+                yield Completion(command, start_position=start)
+            return
+
+        command = words[0].lower()
+        if len(words) == 1 and command in SUBCOMMANDS:
+            for word in _match_list(SUBCOMMANDS[command], current):
+                yield Completion(word, start_position=start)
+            return
+
+        if command == "find":
+            for word, item_ids in self.index.words.search(current):
+                yield Completion(
+                    word, start_position=start, display_meta=_count(item_ids)
+                )
+            return
+
+        if len(words) == 2 and command in ("edit", "open", "del", "done"):
+            job_type = words[1].lower()
+            if job_type not in self.index.items:
+                return
+            for number, subject in self.index.number_matches(job_type, current):
+                yield Completion(
+                    str(number), start_position=start, display_meta=subject
+                )
+            return
+
+        if len(words) == 2 and command == "list":
+            if words[1].lower() == "tags":
+                for tag, item_ids in self.index.tags.search(current):
+                    yield Completion(
+                        tag, start_position=start, display_meta=_count(item_ids)
+                    )
+            elif words[1].lower() == "prio":
+                for priority in _match_list(PRIORITIES, current):
+                    yield Completion(priority, start_position=start)
+
+
+def _match_list(choices, text):
+    text = text.lower()
+    prefix = [choice for choice in choices if choice.startswith(text)]
+    fuzzy = [
+        choice
+        for choice in choices
+        if choice not in prefix and _is_subsequence(text, choice)
+    ]
+    return prefix + fuzzy
+
+
+def _is_subsequence(text, key):
+    position = 0
+    for char in text:
+        position = key.find(char, position) + 1
+        if not position:
+            return False
+    return True
+
+
+def _spread(text, key):
+    """
+    How far apart the characters of `text` are in `key`;
+    smaller is a closer match.
+    """
+    first = position = key.find(text[0])
+    for char in text[1:]:
+        position = key.find(char, position + 1)
+    return position - first
+
+
+def _count(item_ids):
+    return "{} item{}".format(len(item_ids), "" if len(item_ids) == 1 else "s")
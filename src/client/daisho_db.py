@@ -22,22 +22,127 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import datetime
+import heapq
 import logging
 import sys
 
+import bson
 import pymongo
 
+from client import daisho_graphql
+from db import documents, history, recur
+
 HOST = "localhost"
 PORT = "27017"
 
+ADD_TASK = """
+mutation AddTask($subject: String!, $date: String, $tags: [String],
+                 $priority: String, $repeat: String) {
+  addTask(subject: $subject, date: $date, tags: $tags,
+          priority: $priority, repeat: $repeat) { task { id } }
+}
+"""
+
+ADD_NOTE = """
+mutation AddNote($subject: String!, $date: String, $tags: [String],
+                 $priority: String, $note: String) {
+  addNote(subject: $subject, date: $date, tags: $tags,
+          priority: $priority, note: $note) { note { id } }
+}
+"""
+
+LIST_ITEMS = """
+query List($after: String, $date: String, $tag: String, $priority: String,
+           $search: String) {
+  %(field)s(first: 100, after: $after, date: $date, tag: $tag,
+            priority: $priority, search: $search) {
+    edges { node { id subject date tags priority rev %(extra)s } }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+"""
+LIST_TASKS = LIST_ITEMS % {"field": "tasks", "extra": "repeat"}
+LIST_NOTES = LIST_ITEMS % {"field": "notes", "extra": "note"}
+
+BY_PRIORITY = """
+query ByPriority($first: Int, $priority: String) {
+  tasksByPriority(first: $first, priority: $priority) {
+    id subject date tags priority prio urgency
+  }
+  notesByPriority(first: $first, priority: $priority) {
+    id subject date tags priority prio urgency note
+  }
+}
+"""
+
+NEXT_TASKS = """
+query Next($first: Int) {
+  nextTasks(first: $first) { id subject date tags priority prio urgency }
+}
+"""
+
+EDIT_TASK = """
+mutation EditTask($id: ID!, $rev: Int!, $subject: String, $date: String,
+                  $tags: [String], $priority: String, $repeat: String) {
+  editTask(id: $id, rev: $rev, subject: $subject, date: $date, tags: $tags,
+           priority: $priority, repeat: $repeat) { task { rev prio urgency } }
+}
+"""
+
+EDIT_NOTE = """
+mutation EditNote($id: ID!, $rev: Int!, $subject: String, $date: String,
+                  $tags: [String], $priority: String, $note: String) {
+  editNote(id: $id, rev: $rev, subject: $subject, date: $date, tags: $tags,
+           priority: $priority, note: $note) { note { rev prio urgency } }
+}
+"""
+
+REVISION = """
+query Revision($id: ID!, $rev: Int!) {
+  %(field)s(id: $id, rev: $rev) { id subject date tags priority rev %(extra)s }
+}
+"""
+TASK_REVISION = REVISION % {"field": "taskRevision", "extra": "repeat"}
+NOTE_REVISION = REVISION % {"field": "noteRevision", "extra": "note"}
+
+COMPLETE_TASK = """
+mutation CompleteTask($id: ID!, $date: String) {
+  completeTask(id: $id, date: $date) {
+    task { date done done_until: doneUntil prio urgency }
+  }
+}
+"""
+
 logger = logging.getLogger(__name__)
 
+# Set by use_server(); when set, commands go through the GraphQL API
+# instead of connecting to MongoDB.
+transport = None
+
+# The `daisho` db, once mongo_conn() has connected.
+_daisho_db = None
+
+
+def use_server(url, token=None):
+    """
+    Send all commands to the Daisho server at `url`,
+    as the user `token` belongs to, if the server has users.
+    """
+    global transport
+    transport = daisho_graphql.GraphQLTransport(url, token)
+    logger.info("Using the Daisho server at %s", url)
+
 
 def mongo_conn():
     """
     Connect to the local MongoDB
     Create the local db `daisho`, if it doesn't exist
+    The connection is made once, and reused for later calls.
     """
+    global _daisho_db
+    if _daisho_db is not None:
+        return _daisho_db
     try:
         connect = pymongo.MongoClient(HOST + ":" + PORT)
         # Connect to the `daisho` db (will create if non-existing)
@@ -52,29 +157,293 @@ def mongo_conn():
         print(" * Daisho requires an active MongoDB instance on localhost")
         print(" * Check if `mongod` service is running")
         sys.exit()
+    ensure_indexes(daisho_db)
+    _daisho_db = daisho_db
     return daisho_db
 
 
+def ensure_indexes(daisho_db):
+    """
+    Create the indexes `list prio` and `next` sort on,
+    and rank items added before they existed.
+    """
+    for collection in (daisho_db.tasks, daisho_db.notes):
+        collection.create_index(
+            [("prio", pymongo.DESCENDING), ("urgency", pymongo.ASCENDING)]
+        )
+        collection.create_index([("urgency", pymongo.ASCENDING)])
+        for document in collection.find({"urgency": {"$exists": False}}):
+            collection.update_one(
+                {"_id": document["_id"]}, {"$set": documents.rank(document)}
+            )
+    # Only recurring tasks have `starts`.
+    daisho_db.tasks.create_index([("starts", pymongo.ASCENDING)], sparse=True)
+    daisho_db.revisions.create_index(
+        [("item", pymongo.ASCENDING), ("rev", pymongo.ASCENDING)], unique=True
+    )
+
+
+def to_fields(job_dict):
+    """
+    Convert the prompt's fields (`Subject`, `Tags`, ...) to the
+    stored form, with lower case keys and `Tags` split into a list.
+    """
+    fields = {key.lower(): val for key, val in job_dict.items()}
+    tags = fields.get("tags")
+    if isinstance(tags, str):
+        fields["tags"] = tags.replace(",", " ").split()
+    return fields
+
+
 def add_task(task_dict):
     """
     We conect to MongoDB here,
     to add our tasks
+    Returns the id of the new task.
+    A task with a `Repeat` rule recurs, see db/recur.py;
+    it starts today if it has no date.
     """
-    # Add the conector and note adder here
-    print("\nTask added!")
-    pass
+    fields = to_fields(task_dict)
+    if fields.get("repeat"):
+        recur.parse(fields["repeat"])
+        if not fields.get("date"):
+            fields["date"] = datetime.date.today().strftime(recur.DATE_FORMAT)
+    else:
+        fields.pop("repeat", None)
+    if transport is not None:
+        data = transport.execute(ADD_TASK, fields)
+        return data["addTask"]["task"]["id"]
+    fields.update(documents.rank(fields))
+    return str(mongo_conn().tasks.insert_one(fields).inserted_id)
 
 
 def add_note(note_dict):
     """
     We conect to mongodb here,
     to add our notes
+    Returns the id of the new note.
     """
-    # Add the conector and note adder here
+    fields = to_fields(note_dict)
+    if transport is not None:
+        data = transport.execute(ADD_NOTE, fields)
+        note_id = data["addNote"]["note"]["id"]
+    else:
+        fields.update(documents.rank(fields))
+        note_id = str(mongo_conn().notes.insert_one(fields).inserted_id)
     logger.debug("Note added")
-    print("\nNote added!")
+    return note_id
+
+
+class EditConflict(Exception):
     pass
 
 
+def edit_item(item, job_dict):
+    """
+    Save the edited fields of `item`, a task or note as returned by
+    get_items(). Only the fields that changed are sent, and a revision
+    is logged; see db/history.py.
+    Returns the item as edited.
+    """
+    job_type = item["type"]
+    rev = item.get("rev") or 0
+    changes = {
+        key: val
+        for key, val in to_fields(job_dict).items()
+        if item.get(key) != val and (val or item.get(key))
+    }
+    if not changes:
+        return item
+    if changes.get("repeat"):
+        recur.parse(changes["repeat"])
+    if transport is not None:
+        query, field = (
+            (EDIT_TASK, "editTask") if job_type == "task" else (EDIT_NOTE, "editNote")
+        )
+        data = transport.execute(query, dict(changes, id=item["id"], rev=rev))
+        return dict(item, **changes, **data[field][job_type])
+
+    # Rank from the stored task, not from `item`: completing a
+    # recurring task changes its `done` and `urgency`, but not its `rev`.
+    item_id = bson.ObjectId(item["id"])
+    daisho_db = mongo_conn()
+    collection = daisho_db[job_type + "s"]
+    old = collection.find_one({"_id": item_id})
+    if old is None:
+        raise ValueError("The {} was deleted".format(job_type))
+    conflict = EditConflict(
+        "The {} was changed since it was loaded; edit it again".format(job_type)
+    )
+    if (old.get("rev") or 0) != rev:
+        raise conflict
+    new = dict(old, **changes)
+    update = dict(changes, rev=rev + 1)
+    if {"priority", "date", "repeat"} & set(changes):
+        update.update(documents.rank(new))
+    guard = {"rev": rev} if rev else {"rev": {"$exists": False}}
+    guard.update(_id=item_id, done=old.get("done"), done_until=old.get("done_until"))
+    if not collection.update_one(guard, {"$set": update}).matched_count:
+        raise conflict
+    revisions = [history.make_revision(rev + 1, old, new)]
+    if rev == 0:
+        revisions.insert(0, history.make_revision(0, {}, old))
+    for revision in revisions:
+        revision.update(item=item_id, kind=job_type)
+        daisho_db.revisions.insert_one(revision)
+    return dict(item, **update)
+
+
+def get_revision(item, rev):
+    """
+    `item` as it was at revision `rev`, or None if there is no such
+    revision. It is rebuilt from the snapshot at or before `rev` and the
+    deltas after that, so at most history.SNAPSHOT_EVERY
+    revisions are read.
+    """
+    job_type = item["type"]
+    if transport is not None:
+        query, field = (
+            (TASK_REVISION, "taskRevision")
+            if job_type == "task"
+            else (NOTE_REVISION, "noteRevision")
+        )
+        data = transport.execute(query, {"id": item["id"], "rev": rev})
+        return dict(data[field], type=job_type) if data[field] else None
+
+    if not 0 <= rev <= (item.get("rev") or 0):
+        return None
+    if rev == (item.get("rev") or 0):
+        return item
+    base = rev - rev % history.SNAPSHOT_EVERY
+    cursor = (
+        mongo_conn()
+        .revisions.find(
+            {"item": bson.ObjectId(item["id"]), "rev": {"$gte": base, "$lte": rev}}
+        )
+        .sort("rev", pymongo.ASCENDING)
+    )
+    revisions = list(cursor)
+    if not revisions or "snapshot" not in revisions[0]:
+        return None
+    fields = history.rebuild(revisions)
+    return dict(fields, type=job_type, id=item["id"], rev=rev)
+
+
+def complete_task(item, date=None):
+    """
+    Mark the task `item` done on `date`, by default on its
+    first occurrence that is not done yet.
+    Returns the task as updated.
+    """
+    if transport is not None:
+        data = transport.execute(COMPLETE_TASK, {"id": item["id"], "date": date})
+        return dict(item, **data["completeTask"]["task"])
+    tasks = mongo_conn().tasks
+    document = tasks.find_one({"_id": bson.ObjectId(item["id"])})
+    if document is None:
+        raise ValueError("The task was deleted")
+    day = recur.to_date(date) if date else recur.next_due(document)
+    if day is None or not any(recur.pending(document, day, day)):
+        raise ValueError(
+            "The task is not due on {}".format(date) if date else "The task is done"
+        )
+    changes = recur.complete(document, day)
+    changes.update(documents.rank(dict(document, **changes)))
+    guard = {
+        "_id": document["_id"],
+        "done": document.get("done"),
+        "done_until": document.get("done_until"),
+    }
+    if not tasks.update_one(guard, {"$set": changes}).matched_count:
+        raise EditConflict("The task was changed by another edit; try again")
+    return dict(item, **changes)
+
+
+def get_items(filters):
+    """
+    Return the tasks, and then the notes, matching `filters`.
+    Each item is a dict with its `type` and `id`.
+    """
+    if transport is not None:
+        return _get_remote_items(filters)
+    items = []
+    query = documents.item_filter(filters)
+    for job_type, collection in (("task", "tasks"), ("note", "notes")):
+        cursor = mongo_conn()[collection].find(query).sort("_id", pymongo.ASCENDING)
+        for document in cursor:
+            if not documents.on_date(document, filters.get("date")):
+                continue
+            item = {"type": job_type, "id": str(document.pop("_id"))}
+            item.update(document)
+            items.append(item)
+    return items
+
+
+def top_items(first, priority=None):
+    """
+    The `first` tasks and notes with the highest priority, most urgent
+    first within a priority, optionally only those of `priority`.
+    Each collection returns its top `first` from the (prio, urgency)
+    index, and the two short lists are merged.
+    """
+    if transport is not None:
+        data = transport.execute(BY_PRIORITY, {"first": first, "priority": priority})
+        tasks = [dict(item, type="task") for item in data["tasksByPriority"]]
+        notes = [dict(item, type="note") for item in data["notesByPriority"]]
+    else:
+        query = {"prio": documents.to_prio(priority)} if priority else {}
+        order = [("prio", pymongo.DESCENDING), ("urgency", pymongo.ASCENDING)]
+        tasks = _find(("task", "tasks"), query, order, first)
+        notes = _find(("note", "notes"), query, order, first)
+    merged = heapq.merge(
+        tasks, notes, key=lambda item: (-item.get("prio", 0), item.get("urgency"))
+    )
+    return list(merged)[:first]
+
+
+def next_tasks(first):
+    """
+    The `first` most urgent tasks.
+    """
+    if transport is not None:
+        data = transport.execute(NEXT_TASKS, {"first": first})
+        return [dict(item, type="task") for item in data["nextTasks"]]
+    order = [("urgency", pymongo.ASCENDING)]
+    return _find(("task", "tasks"), {}, order, first)
+
+
+def _find(kind, query, order, first):
+    job_type, collection = kind
+    items = []
+    for document in mongo_conn()[collection].find(query).sort(order).limit(first):
+        item = {"type": job_type, "id": str(document.pop("_id"))}
+        item.update(document)
+        items.append(item)
+    return items
+
+
+def _get_remote_items(filters):
+    variables = {key: filters.get(key) for key in ("date", "tag", "priority")}
+    variables["search"] = filters.get("search")
+    pending = [("task", "tasks", LIST_TASKS), ("note", "notes", LIST_NOTES)]
+    items = {"task": [], "note": []}
+    after = {}
+    # Page through tasks and notes together, one round trip per page.
+    while pending:
+        results = transport.batch(
+            [(query, dict(variables, after=after.get(t))) for t, _, query in pending]
+        )
+        still_pending = []
+        for (job_type, field, query), data in zip(pending, results):
+            connection = data[field]
+            for edge in connection["edges"]:
+                items[job_type].append(dict(edge["node"], type=job_type))
+            if connection["pageInfo"]["hasNextPage"]:
+                after[job_type] = connection["pageInfo"]["endCursor"]
+                still_pending.append((job_type, field, query))
+        pending = still_pending
+    return items["task"] + items["note"]
+
+
 if __name__ == "__main__":
     mongo_conn()
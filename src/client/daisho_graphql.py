@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+# MIT License
+
+# Copyright (C) 2018 Vimal A.R <arvimal@yahoo.in>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module talks to the Daisho server's `/graphql` endpoint.
+
+One HTTP/1.1 connection is kept open and reused for every command.
+Queries are sent as persisted-query hashes, falling back to the full
+query text only the first time the server sees them, and several
+operations can be sent together in a single request with `batch()`.
+"""
+
+import gzip
+import hashlib
+import http.client
+import json
+import logging
+import re
+import time
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+# Request bodies larger than this are sent gzip compressed.
+COMPRESS_MIN = 1024
+TIMEOUT = 10
+# Reconnect before sending a mutation on a connection idle for longer
+# than this: the server may have closed it (uvicorn does after 5s), and
+# a mutation is not resent once it may have reached the server.
+IDLE_RECONNECT = 4
+MUTATION = re.compile(r"\s*mutation\b")
+
+
+class GraphQLError(Exception):
+    pass
+
+
+class GraphQLTransport(object):
+    """
+    A keep-alive connection to a Daisho server.
+    """
+
+    def __init__(self, url, token=None):
+        parsed = urllib.parse.urlsplit(url)
+        # For a server with users; see server/tenants.py
+        self.token = token
+        self.path = parsed.path or "/graphql"
+        if parsed.scheme == "https":
+            self.conn = http.client.HTTPSConnection(parsed.netloc, timeout=TIMEOUT)
+        else:
+            self.conn = http.client.HTTPConnection(parsed.netloc, timeout=TIMEOUT)
+        self.hashes = {}
+        self.last_used = 0.0
+
+    def close(self):
+        self.conn.close()
+
+    def execute(self, query, variables=None):
+        """
+        Run one operation and return its `data`.
+        """
+        return self.batch([(query, variables)])[0]
+
+    def batch(self, operations):
+        """
+        Run a list of (query, variables) pairs in one round trip, and
+        return the `data` of each, in order.
+        """
+        payload = [self._operation(query, variables) for query, variables in operations]
+        resend = not any(MUTATION.match(query) for query, _ in operations)
+        results = self._post(payload, resend)
+
+        # Resend, with the query text, whatever the server did not know.
+        missing = [i for i, result in enumerate(results) if _not_persisted(result)]
+        if missing:
+            retry = [dict(payload[i], query=operations[i][0]) for i in missing]
+            for i, result in zip(missing, self._post(retry, resend)):
+                results[i] = result
+
+        data = []
+        for result in results:
+            if result.get("errors"):
+                raise GraphQLError(
+                    "; ".join(err.get("message", "") for err in result["errors"])
+                )
+            data.append(result.get("data"))
+        return data
+
+    def _operation(self, query, variables):
+        digest = self.hashes.get(query)
+        if digest is None:
+            digest = hashlib.sha256(query.encode("utf-8")).hexdigest()
+            self.hashes[query] = digest
+        return {
+            "variables": variables or {},
+            "extensions": {"persistedQuery": {"version": 1, "sha256Hash": digest}},
+        }
+
+    def _post(self, payload, resend):
+        """
+        Send `payload`, reconnecting once if the connection was closed.
+        Unless `resend` is true, the request is not sent again once it
+        may have reached the server.
+        """
+        body = json.dumps(payload).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip",
+            "Connection": "keep-alive",
+        }
+        if self.token:
+            headers["Authorization"] = "Bearer " + self.token
+        if len(body) > COMPRESS_MIN:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+
+        if not resend and time.monotonic() - self.last_used > IDLE_RECONNECT:
+            self.conn.close()
+        try:
+            try:
+                self.conn.request("POST", self.path, body=body, headers=headers)
+            except (http.client.HTTPException, OSError):
+                # Not sent: the server closed the idle connection.
+                logger.debug("Reconnecting to the Daisho server")
+                self.conn.close()
+                self.conn.request("POST", self.path, body=body, headers=headers)
+            try:
+                response = self.conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                if not resend:
+                    raise GraphQLError(
+                        "Lost the connection to the Daisho server; "
+                        "the change may or may not have been saved"
+                    )
+                logger.debug("Reconnecting to the Daisho server")
+                self.conn.request("POST", self.path, body=body, headers=headers)
+                response = self.conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError) as err:
+            self.conn.close()
+            raise GraphQLError("Can't reach the Daisho server: {}".format(err))
+        self.last_used = time.monotonic()
+
+        if response.getheader("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        if response.status != 200:
+            raise GraphQLError(
+                "Server returned {}: {}".format(response.status, data[:200])
+            )
+        return json.loads(data)
+
+
+def _not_persisted(result):
+    return any(
+        err.get("message") == "PersistedQueryNotFound"
+        for err in result.get("errors") or []
+    )
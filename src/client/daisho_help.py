@@ -7,11 +7,15 @@ def usage():
     """
     print("\nUsage:")
     print("1. add  [note] | [task]            - Add a new note or task.")
-    print("2. list [day]  | [all] | [pending] - List to-dos for the day.")
+    print("2. list [day]  | [all] | [prio]    - List to-dos for the day.")
     print("3. edit [note] | [task]  <number>  - Edit a note or task ")
     print("4. open [note] | [task]  <number>  - Open a note or task for more info")
+    print("   open [note] | [task]  <n> --rev k - ... as it was at revision k.")
     print("5. del  [note] | [task]  <number>  - Delete a note / task permanently.")
-    print("6. find <keyword>                  - Search for a keyword.\n")
+    print("6. find <keyword>                  - Search for a keyword.")
+    print("7. next [count]                    - The most urgent tasks.")
+    print("8. done [task] <number> [date]     - Mark a task done.\n")
+    print(" *  profile [on] | [off]           - Profile each command.")
     print(" *  help                           - Prints this help message.")
     print(" *  quit                           - Quits Daisho. \n")
     pass
@@ -39,13 +39,60 @@ This also takes care on opening tasks which has active sub-tasks,
 as well as notes in the pre-configured editor of your choice.
 """
 
+import datetime
+
 from client import daisho_db
 
+DATE_FORMAT = "%d-%m-%Y"
+# How many items `list prio` and `next` show by default.
+TOP_K = 20
+NEXT_K = 5
+
 
-def list_all(val="all"):
+def list_all(val="all", arg=None):
+    """
+    Return the tasks and notes matching the filter `val`.
+    `arg` is the date for `date`, the tag for `tags`
+    and the priority for `prio`.
+
+    `prio` returns the top TOP_K items by priority, and then urgency.
+    """
+    filters = {}
     if val == "today":
-        pass
-        # daisho_db.sys(search.today)
+        filters["date"] = datetime.date.today().strftime(DATE_FORMAT)
     elif val == "tomorrow":
-        pass
-        # daisho_db.sys(search.tomorrow)
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        filters["date"] = tomorrow.strftime(DATE_FORMAT)
+    elif val == "date":
+        filters["date"] = arg
+    elif val == "tags":
+        filters["tag"] = arg
+    elif val == "prio":
+        return daisho_db.top_items(TOP_K, priority=arg)
+    elif val == "trash":
+        # Nothing is moved to the trash yet.
+        return []
+    return daisho_db.get_items(filters)
+
+
+def next_tasks(count=NEXT_K):
+    """
+    The `count` most urgent tasks, by priority and due date.
+    """
+    return daisho_db.next_tasks(count)
+
+
+def format_item(item):
+    """
+    A single, tab separated, line for `item`.
+    """
+    return "\t".join(
+        [
+            item["type"],
+            item["id"],
+            item.get("date") or "-",
+            item.get("priority") or "-",
+            item.get("subject") or "",
+            " ".join(item.get("tags") or []),
+        ]
+    )
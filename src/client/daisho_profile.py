@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# MIT License
+
+# Copyright (C) 2018 Vimal A.R <arvimal@yahoo.in>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Profiling of REPL commands, switched on with `profile on`.
+
+Each command is run under cProfile, its stats are written to a
+`.prof` file (readable with `python -m pstats` or snakeviz), and the
+hottest functions are printed once the command returns.
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+TOP_N = 15
+
+
+class Profiler(object):
+    def __init__(self, directory, top=TOP_N):
+        self.directory = directory
+        self.top = top
+        self.count = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def run(self, name, func, *args, **kwargs):
+        """
+        Call `func` under cProfile, and report on it as `name`.
+        """
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            path = self.dump(name, profile)
+            print(summary(profile, self.top))
+            print("Profile written to {}\n".format(path))
+
+    def dump(self, name, profile):
+        self.count += 1
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")[:40]
+        path = os.path.join(
+            self.directory,
+            "{}-{:04d}-{}.prof".format(
+                time.strftime("%Y%m%d-%H%M%S"), self.count, slug or "command"
+            ),
+        )
+        profile.dump_stats(path)
+        logger.info("Profile for `%s` written to %s", name, path)
+        return path
+
+
+def summary(profile, top=TOP_N):
+    """
+    The `top` functions by cumulative time, as text.
+    """
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats("cumulative").print_stats(top)
+    return stream.getvalue()
@@ -29,14 +29,14 @@ patterns and regular expressions.
 
 import logging
 
-from daisho import daisho_db
+from client import daisho_db
 
 logger = logging.getLogger(__name__)
 
 
-def get_data(table, query):
+def search(keyword):
     """
-    Query the db and return data
+    Return the tasks and notes whose subject, tags or note
+    contain `keyword`, ignoring case.
     """
-    conn_query = daisho_db.mongo_conn()
-    return conn_query.daisho_db.table.find_one(query)
+    return daisho_db.get_items({"search": keyword})
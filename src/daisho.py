@@ -32,15 +32,19 @@ import time
 
 from prompt_toolkit import prompt
 from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
-from prompt_toolkit.completion import WordCompleter
 from prompt_toolkit.history import FileHistory
 from prompt_toolkit.shortcuts import ProgressBar
 from pygments.token import Token
 
 from client import daisho_add
+from client import daisho_batch
+from client import daisho_complete
 from client import daisho_db
+from client import daisho_graphql
 from client import daisho_list
 from client import daisho_help
+from client import daisho_profile
+from client import daisho_search
 
 if sys.version[0] != "3":
     print("\nDaisho requires Python v3")
@@ -52,21 +56,53 @@ DAISHO_HOME = HOME + "/.config/daisho/"
 CONFIG = DAISHO_HOME + "daisho.conf"
 HISTORY = DAISHO_HOME + "history.txt"
 LOG_FILE = DAISHO_HOME + "daisho.log"
+PROFILE_DIR = DAISHO_HOME + "profiles/"
+CMD_LIST = [
+    "add",
+    "del",
+    "list",
+    "next",
+    "find",
+    "edit",
+    "open",
+    "done",
+    "profile",
+    "help",
+    "quit",
+]
 daisho_logger = logging.getLogger(__name__)
 
 
+def connect():
+    """
+    Use the Daisho server set in CONFIG, if any.
+    Otherwise, check if we are able to connect to MongoDB.
+    """
+    conf_parser = configparser.ConfigParser()
+    conf_parser.read(CONFIG)
+    server = conf_parser.get("Global", "SERVER", fallback="")
+    if server:
+        token = conf_parser.get("Global", "TOKEN", fallback="")
+        daisho_db.use_server(server, token=token or None)
+    else:
+        daisho_db.mongo_conn()
+
+
 class Daisho(object):
     """Daisho's main class: Testing"""
 
     def __init__(self):
+        # Set by `profile on`, see profile()
+        self.profiler = None
+        # Completions, kept up to date as items are added
+        self.index = daisho_complete.CompletionIndex()
         # Check existence of CONFIG
         if all([pathlib.Path(CONFIG).exists()]):
             daisho_logger.info(
                 "{} exists, Welcome to Daisho".format(pathlib.Path(CONFIG))
             )
             print("\n\t- Welcome to Daisho -\n")
-            # Check if we are able to connect to MongoDB.
-            daisho_db.mongo_conn()
+            connect()
             daisho_help.usage()
             self.daisho_prompt()
             daisho_logger.info("Started Daisho prompt.")
@@ -88,6 +124,11 @@ class Daisho(object):
             conf_parser.set("Global", "CONFIG", CONFIG)
             conf_parser.set("Global", "HISTORY", HISTORY)
             conf_parser.set("Global", "LOG_FILE", LOG_FILE)
+            # Set SERVER to a Daisho server's URL, eg. `http://host:8000/graphql`,
+            # to use it instead of a local MongoDB.
+            conf_parser.set("Global", "SERVER", "")
+            # Your token, if the server has users (`daisho-server --users`).
+            conf_parser.set("Global", "TOKEN", "")
             with open(CONFIG, "w") as config_file:
                 conf_parser.write(config_file)
             print("\tDone")
@@ -96,8 +137,7 @@ class Daisho(object):
             logging.basicConfig(filename=LOG_FILE, level=logging.INFO)
             logging.info("Generating configuration files.")
             logging.info("#### Daisho starting up ####")
-            # Check if we are able to connect to MongoDB.
-            daisho_db.mongo_conn()
+            connect()
             daisho_help.usage()
             self.daisho_prompt()
             logging.info("Started Daisho prompt.")
@@ -106,8 +146,12 @@ class Daisho(object):
         """
         Daisho's prompt.
         """
-        cmd_list = ["add", "del", "list", "find", "edit", "open", "help", "quit"]
-        keyword_completer = WordCompleter(cmd_list, ignore_case=True)
+        # The only query made for completions; see daisho_complete.py
+        try:
+            self.index.load(daisho_db.get_items({}))
+        except daisho_graphql.GraphQLError as err:
+            sys.exit("\n{}\n".format(err))
+        keyword_completer = daisho_complete.DaishoCompleter(self.index, CMD_LIST)
 
         while True:
             daisho_prompt = prompt(
@@ -118,114 +162,229 @@ class Daisho(object):
             )
             # Split the input to a list
             values = [i for i in daisho_prompt.split()]
-            key_word = values[0].lower()
-
-            if key_word in cmd_list:
-                # Case 1: key_word is `help` / `quit` / `list`
-                # `help` and `quit` are cases where a single arg is valid.
-                # `list` without args should list all tasks and notes [Feature]
-                if len(values) == 1:
-                    if key_word == "help":
-                        self.daisho_help()
-                    elif key_word == "quit":
-                        sys.exit("\nExiting Daisho.\n")
-                    elif key_word == "list":
-                        self.list_tasks(criteria="all")
+            if not values:
+                continue
+            try:
+                if self.profiler is not None:
+                    self.profiler.run(" ".join(values), self.run_command, values)
+                else:
+                    self.run_command(values)
+            except daisho_graphql.GraphQLError as err:
+                # The server is down, or refused the request (a bad
+                # token, its rate limit or a quota): keep the prompt.
+                print("\n{}\n".format(err))
+
+    def run_command(self, values):
+        """
+        Run a single command, split into a list of words.
+        """
+        key_word = values[0].lower()
+
+        if key_word in CMD_LIST:
+            # Case 1: key_word is `help` / `quit` / `list`
+            # `help` and `quit` are cases where a single arg is valid.
+            # `list` without args should list all tasks and notes [Feature]
+            if len(values) == 1:
+                if key_word == "help":
+                    daisho_help.usage()
+                elif key_word == "quit":
+                    sys.exit("\nExiting Daisho.\n")
+                elif key_word == "list":
+                    self.list_tasks(criteria="all")
+                elif key_word == "next":
+                    self.next_tasks()
+                else:
+                    daisho_help.usage()
+
+            elif len(values) > 1:
+                # Case 2: key_word is "add"
+                if key_word == "add":
+                    add_args = ["note", "task"]
+                    if values[1].lower() in add_args:
+                        item = daisho_add.add_prompt(job_type=values[1].lower())
+                        if item is not None:
+                            self.index.add_item(item)
                     else:
-                        self.daisho_help()
-                        self.daisho_prompt()
-
-                elif len(values) > 1:
-                    # Case 2: key_word is "add"
-                    if key_word == "add":
-                        add_args = ["note", "task"]
-                        if values[1].lower() in add_args:
-                            daisho_add.add_prompt(job_type=values[1].lower())
-                            self.daisho_prompt()
-                        else:
-                            print(daisho_add.add_prompt.__doc__)
-                            self.daisho_prompt()
-
-                    # Case 3: key_word is "list"
-                    if key_word == "list":
-                        list_args = ["all", "today", "tags", "prio", "trash"]
-                        if values[1].lower() in list_args:
-                            self.list_tasks(criteria=values[1].lower())
-                        else:
-                            print(self.list_tasks.__doc__)
-                            self.daisho_prompt()
-
-                    # Case 4: key_word is "edit"
-                    if key_word == "edit":
-                        edit_args = ["task", "note"]
-                        if values[1].lower() in edit_args:
-                            try:
-                                if values[2]:
-                                    try:
-                                        job_type, num = (
-                                            values[1].lower(),
-                                            int(values[2]),
-                                        )
-                                        self.edit_jobs(job_type=job_type, number=num)
-                                    except ValueError:
-                                        print(self.edit_jobs.__doc__)
-                                        self.daisho_prompt()
-                            except IndexError:
-                                print(self.edit_jobs.__doc__)
-                                self.daisho_prompt()
-                        else:
-                            # print("`edit` takes either `task` or `note` as argument.")
+                        print(daisho_add.add_prompt.__doc__)
+
+                # Case 3: key_word is "list"
+                if key_word == "list":
+                    list_args = [
+                        "all",
+                        "today",
+                        "tomorrow",
+                        "date",
+                        "tags",
+                        "prio",
+                        "trash",
+                    ]
+                    if values[1].lower() in list_args:
+                        self.list_tasks(
+                            criteria=values[1].lower(),
+                            value=values[2] if len(values) > 2 else None,
+                        )
+                    else:
+                        print(self.list_tasks.__doc__)
+
+                # Case 4: key_word is "edit"
+                if key_word == "edit":
+                    edit_args = ["task", "note"]
+                    if values[1].lower() in edit_args:
+                        try:
+                            if values[2]:
+                                try:
+                                    job_type, num = (
+                                        values[1].lower(),
+                                        int(values[2]),
+                                    )
+                                    self.edit_jobs(job_type=job_type, number=num)
+                                except ValueError:
+                                    print(self.edit_jobs.__doc__)
+                        except IndexError:
                             print(self.edit_jobs.__doc__)
-                            self.daisho_prompt()
-
-                    # Case 5: key_word is "open"
-                    if key_word == "open":
-                        open_args = ["task", "note"]
-                        if values[1].lower() in open_args:
-                            try:
-                                if values[2]:
-                                    try:
-                                        job_type, num = (
-                                            values[1].lower(),
-                                            int(values[2]),
-                                        )
-                                        self.open_jobs(job_type=job_type, number=num)
-                                    except ValueError:
-                                        print(self.open_jobs.__doc__)
-                                        self.daisho_prompt()
-                            except IndexError:
-                                print(self.open_jobs.__doc__)
-                                self.daisho_prompt()
-                        else:
-                            # print("`edit` takes either `task` or `note` as argument.")
+                    else:
+                        # print("`edit` takes either `task` or `note` as argument.")
+                        print(self.edit_jobs.__doc__)
+
+                # Case 5: key_word is "open"
+                if key_word == "open":
+                    open_args = ["task", "note"]
+                    if values[1].lower() in open_args:
+                        try:
+                            if values[2]:
+                                try:
+                                    job_type, num = (
+                                        values[1].lower(),
+                                        int(values[2]),
+                                    )
+                                    rev = None
+                                    if len(values) > 3:
+                                        if values[3] != "--rev":
+                                            raise ValueError
+                                        rev = int(values[4])
+                                    self.open_jobs(
+                                        job_type=job_type, number=num, rev=rev
+                                    )
+                                except ValueError:
+                                    print(self.open_jobs.__doc__)
+                        except IndexError:
                             print(self.open_jobs.__doc__)
-                            self.daisho_prompt()
+                    else:
+                        # print("`edit` takes either `task` or `note` as argument.")
+                        print(self.open_jobs.__doc__)
+
+                # Case 6: key_word is "done"
+                if key_word == "done":
+                    try:
+                        if values[1].lower() != "task":
+                            raise ValueError
+                        self.complete_task(
+                            number=int(values[2]),
+                            date=values[3] if len(values) > 3 else None,
+                        )
+                    except (IndexError, ValueError):
+                        print(self.complete_task.__doc__)
+
+                # Case 7: key_word is "next"
+                if key_word == "next":
+                    try:
+                        self.next_tasks(count=int(values[1]))
+                    except ValueError:
+                        print(self.next_tasks.__doc__)
+
+                # Case 8: key_word is "find"
+                if key_word == "find":
+                    self.search_tasks(*values[1:])
+
+                # Case 9: key_word is "profile"
+                if key_word == "profile":
+                    self.profile(values[1].lower())
 
-            else:
-                # if values[0].lower() not in list
-                self.daisho_help()
+        else:
+            # if values[0].lower() not in list
+            daisho_help.usage()
 
-    def list_tasks(self, criteria=None):
+    def list_tasks(self, criteria=None, value=None):
         """
         `list` accepts the following arguments:
             * all
             * today
+            * tomorrow
             * date, in `DD-MM-YYYY` format
-            * tags
-            * prio
+            * tags, and a tag
+            * prio, and optionally #high, #med or #low
             * trash
         """
-        print("List called with argument `{}`".format(criteria))
-        pass
+        if criteria in ("date", "tags") and value is None:
+            print(self.list_tasks.__doc__)
+            return
+        for item in daisho_list.list_all(criteria, value):
+            print(daisho_list.format_item(item))
+
+    def next_tasks(self, count=daisho_list.NEXT_K):
+        """
+        `next` lists the most urgent tasks, by priority and due date.
+        It accepts an optional count.
+
+        Example:
+            ->> next    # The 5 most urgent tasks.
+            ->> next 10 # The 10 most urgent tasks.
+        """
+        for item in daisho_list.next_tasks(count):
+            print(daisho_list.format_item(item))
 
     def search_tasks(self, *args):
         """
-        `search` accepts a keyword, to search.
+        `find` accepts a keyword, to search.
 
         It returns the notes / tasks which contain the keyword.
         """
-        print(self.search_tasks.__doc__)
-        pass
+        for item in daisho_search.search(" ".join(args)):
+            print(daisho_list.format_item(item))
+
+    def complete_task(self, number, date=None):
+        """
+        `done` accepts `task`, a number, and optionally a date,
+        in `DD-MM-YYYY` format.
+
+        It marks the task done. For a recurring task, that is
+        the occurrence on the date, or else the first one not
+        done yet.
+
+        Example:
+            ->> done task 3            # Done with the 3rd task.
+            ->> done task 3 20-10-2026 # Done with it for 20-10-2026.
+        """
+        item = self.index.item("task", number)
+        if item is None:
+            print("\nNo task #{}\n".format(number))
+            return
+        try:
+            item = daisho_db.complete_task(item, date)
+        except (ValueError, daisho_db.EditConflict, daisho_graphql.GraphQLError) as err:
+            print("\n{}\n".format(err))
+            return
+        self.index.add_item(item)
+        print("\nDone!\n")
+
+    def profile(self, state):
+        """
+        `profile` accepts the following arguments.
+            * on
+            * off
+
+        With profiling on, each command is run under cProfile. A profile
+        file is written to `~/.config/daisho/profiles/` and the hottest
+        functions are printed after the command.
+        """
+        if state == "on":
+            self.profiler = daisho_profile.Profiler(PROFILE_DIR)
+            print("\nProfiling on, writing to {}\n".format(PROFILE_DIR))
+        elif state == "off":
+            self.profiler = None
+            print("\nProfiling off\n")
+        else:
+            print(self.profile.__doc__)
 
     def edit_jobs(self, job_type, number):
         """
@@ -237,21 +396,66 @@ class Daisho(object):
             ->> edit note 4 # To edit the 4th note in the list.
             ->> edit task 3 # To edit the 5th task in the list.
         """
-        print("\nEditing {}: #{}\n".format(job_type, number))
-
-    def open_jobs(self, job_type, number):
+        item = self.index.item(job_type, number)
+        if item is None:
+            print("\nNo {} #{}\n".format(job_type, number))
+            return
+        try:
+            item = daisho_add.edit_prompt(item)
+        except (daisho_db.EditConflict, daisho_graphql.GraphQLError) as err:
+            print("\n{}\n".format(err))
+            # Pick up the other edit, so the next try starts from it.
+            self.index.load(daisho_db.get_items({}))
+            return
+        self.index.add_item(item)
+
+    def open_jobs(self, job_type, number, rev=None):
         """
         `open` accepts the following arguments, and a number.
             * note
             * task
+        and optionally `--rev` and a revision, to open a past version.
 
         Example:
             ->> open note 4 # To open the 4th note in the list.
             ->> open task 3 # To open the 5th task in the list.
+            ->> open note 4 --rev 2 # The 4th note, as it was at revision 2.
         """
-        print("\nEditing {}: #{}\n".format(job_type, number))
+        item = self.index.item(job_type, number)
+        if item is None:
+            print("\nNo {} #{}\n".format(job_type, number))
+            return
+        if rev is not None:
+            found = daisho_db.get_revision(item, rev)
+            if found is None:
+                print("\n{} #{} has no revision {}\n".format(job_type, number, rev))
+                return
+            item = found
+        print(
+            "\n{} #{}, revision {}\n".format(
+                job_type.title(), number, item.get("rev") or 0
+            )
+        )
+        for key in ("subject", "date", "tags", "priority"):
+            value = item.get(key)
+            if key == "tags":
+                value = " ".join(value or [])
+            print("{:>10} : {}".format(key.title(), value or ""))
+        if job_type == "note":
+            print("\n{}".format(item.get("note") or ""))
+        print()
+
+
+def main(argv=None):
+    """
+    Start the REPL, or run a single command / script without one.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        Daisho()
+        return 0
+    return daisho_batch.main(argv, connect)
 
 
 if __name__ == "__main__":
-    my_daisho = Daisho()
-    my_daisho
+    sys.exit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""
+Fields the CLI (with a local MongoDB) and the Daisho server derive
+from stored tasks and notes: their rank, for the priority views, and
+the MongoDB query for a listing's filters.
+"""
+
+import datetime
+import re
+
+from db import recur
+
+# Priorities are stored as an ordinal, `prio`, for sorting.
+PRIORITIES = {"high": 3, "med": 2, "low": 1}
+# A task becomes as urgent as an unprioritised task due on the same day,
+# this many days before its own due date.
+PRIORITY_LEAD = {3: 7, 2: 3, 1: 0, 0: 0}
+# `urgency` for items without a (valid) date.
+NO_DATE = datetime.date(9999, 12, 31).toordinal()
+
+
+def to_prio(priority):
+    """
+    `#high`, `med`, etc. as an ordinal; 0 if unknown.
+    """
+    return PRIORITIES.get((priority or "").lower().lstrip("#"), 0)
+
+
+def rank(fields):
+    """
+    The `prio` ordinal and `urgency` of an item; lower `urgency` is
+    more urgent. Neither depends on the current date, so they are
+    computed once, when the item is written.
+    A recurring task is due on its first occurrence that is not done,
+    and also gets `starts`, the ordinal of its first occurrence.
+    """
+    prio = to_prio(fields.get("priority"))
+    due = recur.next_due(fields)
+    due = due.toordinal() if due is not None else NO_DATE
+    ranks = {"prio": prio, "urgency": due - PRIORITY_LEAD[prio]}
+    start = recur.to_date(fields.get("date"))
+    if fields.get("repeat") and start is not None:
+        ranks["starts"] = start.toordinal()
+    return ranks
+
+
+def item_filter(filters):
+    """
+    Build a MongoDB query from `filters`, which may have
+    `date`, `tag`, `priority` and `search` (a keyword).
+    """
+    query = {}
+    if filters.get("date"):
+        dated = {"date": filters["date"], "repeat": {"$in": [None, ""]}}
+        day = recur.to_date(filters["date"])
+        if day is None:
+            query.update(dated)
+        else:
+            # Recurring tasks that started by then may occur on the
+            # day; on_date() picks the ones that do.
+            started = {"starts": {"$lte": day.toordinal()}}
+            query["$and"] = [{"$or": [dated, started]}]
+    if filters.get("tag"):
+        query["tags"] = filters["tag"]
+    if filters.get("priority"):
+        query["priority"] = filters["priority"]
+    if filters.get("search"):
+        keyword = {"$regex": re.escape(filters["search"]), "$options": "i"}
+        query["$or"] = [{"subject": keyword}, {"note": keyword}, {"tags": keyword}]
+    return query
+
+
+def on_date(document, date):
+    """
+    Whether `document`, matched by item_filter(), is due on `date`
+    and not done. A recurring task is given the date it occurs on.
+    """
+    if not date or recur.to_date(date) is None:
+        return True
+    if not recur.occurs(document, date):
+        return False
+    document["date"] = date
+    return True
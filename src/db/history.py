@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+Revision history for tasks and notes.
+
+Every edit adds a revision to the `revisions` collection. Revision 0 is
+the item as it was before its first edit. Every SNAPSHOT_EVERY-th
+revision is a full snapshot of the item; the others only hold a delta
+from the revision before: the fields that were set or removed, and for
+long text fields (the note itself), a line diff rather than a copy.
+
+Any revision is rebuilt from the closest snapshot at or before it, plus
+at most SNAPSHOT_EVERY - 1 deltas.
+
+The CLI (with a local MongoDB) and the Daisho server both use this.
+"""
+
+import difflib
+
+SNAPSHOT_EVERY = 10
+
+# The fields kept in the history.
+FIELDS = ("subject", "date", "tags", "priority", "repeat", "note")
+# Fields stored as line diffs.
+TEXT_FIELDS = ("note",)
+
+
+def history_fields(item):
+    return {key: item[key] for key in FIELDS if key in item}
+
+
+def make_revision(rev, old, new):
+    """
+    The revision `rev`, which turns `old` into `new`.
+    """
+    if rev % SNAPSHOT_EVERY == 0:
+        return {"rev": rev, "snapshot": history_fields(new)}
+    return {"rev": rev, "delta": make_delta(old, new)}
+
+
+def make_delta(old, new):
+    old, new = history_fields(old), history_fields(new)
+    delta = {}
+    changed = {key: val for key, val in new.items() if old.get(key) != val}
+    for key in TEXT_FIELDS:
+        if key in changed and isinstance(old.get(key), str):
+            delta.setdefault("text", {})[key] = diff_lines(old[key], changed.pop(key))
+    if changed:
+        delta["set"] = changed
+    removed = [key for key in old if key not in new]
+    if removed:
+        delta["unset"] = removed
+    return delta
+
+
+def apply_delta(fields, delta):
+    fields = dict(fields)
+    for key, ops in delta.get("text", {}).items():
+        fields[key] = patch_lines(fields.get(key) or "", ops)
+    fields.update(delta.get("set", {}))
+    for key in delta.get("unset", []):
+        fields.pop(key, None)
+    return fields
+
+
+def rebuild(revisions):
+    """
+    Rebuild an item from its revisions: a snapshot,
+    followed by the deltas after it, in order.
+    """
+    fields = dict(revisions[0]["snapshot"])
+    for revision in revisions[1:]:
+        fields = apply_delta(fields, revision["delta"])
+    return fields
+
+
+def diff_lines(old, new):
+    """
+    A compact line diff: ["=", n] keeps n lines, ["-", n] drops n lines
+    and ["+", lines] inserts lines.
+    """
+    old_lines = old.splitlines(True)
+    new_lines = new.splitlines(True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["=", i2 - i1])
+            continue
+        if i2 > i1:
+            ops.append(["-", i2 - i1])
+        if j2 > j1:
+            ops.append(["+", new_lines[j1:j2]])
+    return ops
+
+
+def patch_lines(old, ops):
+    old_lines = old.splitlines(True)
+    new_lines = []
+    position = 0
+    for op, arg in ops:
+        if op == "=":
+            new_lines.extend(old_lines[position : position + arg])
+            position += arg
+        elif op == "-":
+            position += arg
+        else:
+            new_lines.extend(arg)
+    return "".join(new_lines)
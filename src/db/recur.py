@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+"""
+Recurring tasks.
+
+A recurring task stores its rule once, in `repeat`, and its first
+occurrence in `date`. A rule is one of:
+
+    daily, weekly, monthly, yearly
+    every N days | weeks | months | years
+    a cron expression, `minute hour day-of-month month day-of-week`
+
+Daisho dates have no time of day, so a cron expression's minute and
+hour are ignored.
+
+Occurrences are never stored. occurrences() generates the ones in a
+given window, so listing a day costs the same however long a series
+runs. Completed occurrences are stored sparsely: `done_until` is the
+last of the run of completed occurrences from the start, and `done` has
+the completed occurrences after it.
+
+The CLI (with a local MongoDB) and the Daisho server both use this.
+"""
+
+import calendar
+import datetime
+import functools
+import re
+
+DATE_FORMAT = "%d-%m-%Y"
+# How far next_due() looks for an occurrence that is not done.
+HORIZON = datetime.timedelta(days=5 * 366)
+ONE_DAY = datetime.timedelta(days=1)
+
+ALIASES = {
+    "daily": ("days", 1),
+    "weekly": ("days", 7),
+    "monthly": ("months", 1),
+    "yearly": ("months", 12),
+}
+EVERY = re.compile(r"every (\d+) (day|week|month|year)s?")
+
+
+def to_date(text):
+    try:
+        return datetime.datetime.strptime(text or "", DATE_FORMAT).date()
+    except (TypeError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=256)
+def parse(rule):
+    """
+    Parse `rule`, raising ValueError if it is not valid.
+    """
+    words = rule.lower().split()
+    if len(words) == 1 and words[0] in ALIASES:
+        return ALIASES[words[0]]
+    match = EVERY.fullmatch(" ".join(words))
+    if match and int(match.group(1)) > 0:
+        count, unit = int(match.group(1)), match.group(2)
+        if unit in ("day", "week"):
+            return ("days", count * (7 if unit == "week" else 1))
+        return ("months", count * (12 if unit == "year" else 1))
+    if len(words) == 5:
+        try:
+            days = _cron_field(words[2], 1, 31)
+            months = _cron_field(words[3], 1, 12)
+            weekdays = frozenset(day % 7 for day in _cron_field(words[4], 0, 7))
+        except ValueError:
+            pass
+        else:
+            return ("cron", (days, months, weekdays, words[2] == "*", words[4] == "*"))
+    raise ValueError("Unknown repeat rule `{}`".format(rule))
+
+
+def _cron_field(text, low, high):
+    values = set()
+    for part in text.split(","):
+        spec, slash, step = part.partition("/")
+        step = int(step) if slash else 1
+        if spec == "*":
+            first, last = low, high
+        elif "-" in spec:
+            first, last = (int(value) for value in spec.split("-", 1))
+        else:
+            first = int(spec)
+            last = high if slash else first
+        if step < 1 or not low <= first <= last <= high:
+            raise ValueError(part)
+        values.update(range(first, last + 1, step))
+    return frozenset(values)
+
+
+def _cron_matches(spec, day):
+    days, months, weekdays, any_day, any_weekday = spec
+    if day.month not in months:
+        return False
+    in_days = day.day in days
+    # cron's day of week counts from Sunday.
+    in_weekdays = (day.weekday() + 1) % 7 in weekdays
+    if any_day or any_weekday:
+        return in_days and in_weekdays
+    # With both restricted, cron matches either.
+    return in_days or in_weekdays
+
+
+def occurrences(rule, start, first, last):
+    """
+    Yield the days from `first` to `last` on which `rule`, starting
+    on `start`, occurs. Only days in the window are looked at.
+    """
+    kind, arg = parse(rule)
+    first = max(first, start)
+    if kind == "days":
+        # Jump straight to the first occurrence in the window.
+        day = start + datetime.timedelta(days=-(-(first - start).days // arg) * arg)
+        while day <= last:
+            yield day
+            day += datetime.timedelta(days=arg)
+    elif kind == "months":
+        origin = start.year * 12 + start.month - 1
+        month = first.year * 12 + first.month - 1
+        month += -(month - origin) % arg
+        while month < 10000 * 12:
+            year, index = divmod(month, 12)
+            # The 31st of each month falls on the last day of shorter ones.
+            length = calendar.monthrange(year, index + 1)[1]
+            day = datetime.date(year, index + 1, min(start.day, length))
+            if day > last:
+                return
+            if day >= first:
+                yield day
+            month += arg
+    else:
+        day = first
+        while day <= last:
+            if _cron_matches(arg, day):
+                yield day
+            if day == datetime.date.max:
+                return
+            day += ONE_DAY
+
+
+def _all_occurrences(fields, first, last):
+    start = to_date(fields.get("date"))
+    if start is None:
+        return iter(())
+    if fields.get("repeat"):
+        return occurrences(fields["repeat"], start, first, last)
+    return iter([start] if first <= start <= last else [])
+
+
+def pending(fields, first, last):
+    """
+    Yield the days from `first` to `last` on which the task
+    `fields` occurs, and that occurrence is not done.
+    """
+    until = to_date(fields.get("done_until"))
+    if until is not None:
+        first = max(first, until + ONE_DAY)
+    done = set(fields.get("done") or [])
+    for day in _all_occurrences(fields, first, last):
+        if day.strftime(DATE_FORMAT) not in done:
+            yield day
+
+
+def occurs(fields, day):
+    """
+    Whether the task `fields` occurs, and is not done, on `day`.
+    """
+    day = to_date(day)
+    return day is not None and any(pending(fields, day, day))
+
+
+def next_due(fields):
+    """
+    The first occurrence of the task `fields` that is not done, or None.
+    """
+    first = to_date(fields.get("done_until")) or to_date(fields.get("date"))
+    if first is None:
+        return None
+    return next(pending(fields, first, first + HORIZON), None)
+
+
+def complete(fields, day):
+    """
+    The `done` and `done_until` fields of the task `fields`,
+    with its occurrence on `day` done.
+    """
+    done = set(fields.get("done") or []) | {day.strftime(DATE_FORMAT)}
+    until = to_date(fields.get("done_until"))
+    first = until + ONE_DAY if until is not None else datetime.date.min
+    last = max(to_date(text) for text in done)
+    # Fold the completed occurrences that follow `done_until` into it.
+    for occurrence in _all_occurrences(fields, first, last):
+        text = occurrence.strftime(DATE_FORMAT)
+        if text not in done:
+            break
+        done.remove(text)
+        until = occurrence
+    return {
+        "done": sorted(done, key=to_date),
+        "done_until": until.strftime(DATE_FORMAT) if until is not None else None,
+    }
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+"""
+In-process change feed for task and note events.
+
+Writers call `feed.publish()`; every GraphQL subscription holds a
+`Subscriber` with its own bounded backlog. Events for the same item
+are coalesced while they wait, so a slow client only ever receives the
+latest state of each item. A client that falls further behind than
+`QUEUE_SIZE` distinct items gets a single `resync` instead, and is
+expected to re-query.
+
+A subscriber only receives events for its own user's items (see
+`tenants.py`).
+
+`watch_mongo()` feeds the broker from a MongoDB change stream, so
+writes made directly against the db are published as well.
+"""
+
+import asyncio
+import collections
+import logging
+
+import pymongo
+
+import database
+
+KINDS = ("task", "note")
+QUEUE_SIZE = 256
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber(object):
+    """
+    Pending events for one client, keyed by (kind, id).
+    """
+
+    def __init__(self, kinds=KINDS, maxsize=QUEUE_SIZE, tenant=None):
+        self.kinds = set(kinds)
+        self.tenant = tenant
+        self.maxsize = maxsize
+        self.pending = collections.OrderedDict()
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def push(self, event):
+        if event["kind"] not in self.kinds:
+            return
+        # Deletes from the change stream have no data, so whose item it
+        # was is unknown; only a server without users passes them on.
+        if (event["data"] or {}).get("tenant") != self.tenant:
+            return
+        key = (event["kind"], event["id"])
+        previous = self.pending.get(key)
+        if previous is not None:
+            # An insert followed by updates is still an insert for a
+            # client that has not seen it yet.
+            if previous["op"] == "insert" and event["op"] == "update":
+                event = dict(event, op="insert")
+            self.pending[key] = event
+        elif self.overflowed:
+            return
+        elif len(self.pending) >= self.maxsize:
+            self.pending.clear()
+            self.overflowed = True
+        else:
+            self.pending[key] = event
+        self.ready.set()
+
+    async def get(self):
+        """
+        Wait for, and drain, everything pending.
+        Returns a list of events, or None if the client must resync.
+        """
+        await self.ready.wait()
+        self.ready.clear()
+        if self.overflowed:
+            self.overflowed = False
+            return None
+        events = list(self.pending.values())
+        self.pending.clear()
+        return events
+
+
+class ChangeFeed(object):
+    """
+    Fan out change events to subscribers.
+
+    `listeners` are called with every event, synchronously and from the
+    publishing thread, before any subscriber sees it.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.listeners = []
+        self.loop = None
+
+    def subscribe(self, kinds=KINDS, maxsize=QUEUE_SIZE, tenant=None):
+        subscriber = Subscriber(kinds=kinds, maxsize=maxsize, tenant=tenant)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, kind, op, item_id, data=None):
+        """
+        `op` is one of `insert`, `update` or `delete`.
+        Must be called from the event loop thread.
+        """
+        event = self.notify(kind, op, item_id, data)
+        self.push(event)
+
+    def publish_threadsafe(self, kind, op, item_id, data=None):
+        """
+        `publish()` from a worker thread, e.g. a GraphQL resolver.
+        """
+        event = self.notify(kind, op, item_id, data)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.push, event)
+
+    def notify(self, kind, op, item_id, data):
+        event = {"kind": kind, "op": op, "id": str(item_id), "data": data}
+        for listener in self.listeners:
+            listener(event)
+        return event
+
+    def push(self, event):
+        for subscriber in list(self.subscribers):
+            subscriber.push(event)
+
+
+feed = ChangeFeed()
+
+
+def watch_mongo(stop):
+    """
+    Publish MongoDB change stream events to `feed` until `stop` is set.
+    Runs in a worker thread; change streams need a replica set, so on a
+    standalone `mongod` this logs a warning and returns.
+    """
+    kinds = {coll: kind for kind, coll in database.COLLECTIONS.items()}
+    ops = {
+        "insert": "insert",
+        "update": "update",
+        "replace": "update",
+        "delete": "delete",
+    }
+    try:
+        with database.mongo_conn().watch(full_document="updateLookup") as stream:
+            while not stop.is_set():
+                change = stream.try_next()
+                if change is None:
+                    stop.wait(0.5)
+                    continue
+                kind = kinds.get(change.get("ns", {}).get("coll"))
+                op = ops.get(change["operationType"])
+                if kind is None or op is None:
+                    continue
+                document = change.get("fullDocument")
+                if document is not None:
+                    document = {k: v for k, v in document.items() if k != "_id"}
+                feed.publish_threadsafe(
+                    kind, op, change["documentKey"]["_id"], document
+                )
+    except pymongo.errors.PyMongoError as err:
+        logger.warning("MongoDB change stream unavailable: %s", err)
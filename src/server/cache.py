@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""
+Response cache for read-only endpoints.
+
+Entries are keyed by an ETag computed from the request (query,
+variables, operation name), the user, and the current data version of
+that user. Every change published to the change feed bumps the version
+of the changed item's user, so the ETag of a request can be checked
+against `If-None-Match` without running the query or touching the db,
+and one user's writes don't invalidate the others' responses.
+"""
+
+import collections
+import hashlib
+import json
+import threading
+
+from starlette.responses import Response
+
+import broker
+
+CACHE_SIZE = 512
+
+
+class ResponseCache(object):
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.version = 0
+        # Per tenant, see tenants.py.
+        self.versions = {}
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def etag(self, *parts, tenant=None):
+        version = (self.version, self.versions.get(tenant, 0))
+        key = json.dumps([version, tenant, parts], sort_keys=True, default=str)
+        return '"{}"'.format(hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def get(self, tag):
+        with self.lock:
+            body = self.entries.get(tag)
+            if body is not None:
+                self.entries.move_to_end(tag)
+            return body
+
+    def put(self, tag, body):
+        with self.lock:
+            self.entries[tag] = body
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, event=None):
+        data = (event or {}).get("data")
+        with self.lock:
+            if data is None:
+                # Not known whose item changed.
+                self.version += 1
+                self.entries.clear()
+            else:
+                tenant = data.get("tenant")
+                self.versions[tenant] = self.versions.get(tenant, 0) + 1
+
+
+def not_modified(request, tag):
+    """
+    Return a 304 response if the client already has `tag`, else None.
+    """
+    if request.headers.get("if-none-match") == tag:
+        return Response(status_code=304, headers={"ETag": tag})
+    return None
+
+
+cache = ResponseCache()
+broker.feed.listeners.append(cache.invalidate)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+"""
+MongoDB access for the Daisho server.
+
+Tasks and notes live in the `tasks` and `notes` collections
+of the `daisho` db, the same db the CLI connects to.
+
+Each server worker process has its own client, and so its own
+connection pool of up to `DAISHO_POOL_SIZE` connections. With
+`DAISHO_STORE=memory`, the in-memory stand-in from `memory_store.py`
+is used instead of MongoDB.
+
+Every function takes the `tenant` (user name) whose items it may see,
+see tenants.py; None is the single user of a server without users, and
+matches items without a `tenant`. The indexes start with `tenant`, so
+each user's queries only scan their own items.
+"""
+
+import datetime
+import logging
+import os
+
+import bson
+import pymongo
+
+import memory_store
+from db import documents, history, recur
+
+HOST = "localhost"
+PORT = "27017"
+POOL_SIZE = int(os.environ.get("DAISHO_POOL_SIZE", "100"))
+STORE = os.environ.get("DAISHO_STORE", "mongo")
+
+COLLECTIONS = {"task": "tasks", "note": "notes"}
+# Past revisions of edited tasks and notes, see db/history.py.
+REVISIONS = "revisions"
+# A page filtered by date reads at most this many documents.
+MAX_SCAN = 1000
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def mongo_conn():
+    """
+    Return the `daisho` db.
+    The client (and its connection pool) is created on first use.
+    """
+    global _client
+    if STORE == "memory":
+        return memory_store.database
+    if _client is None:
+        _client = pymongo.MongoClient(HOST + ":" + PORT, maxPoolSize=POOL_SIZE)
+        logger.info("Connected to MongoDB at %s:%s", HOST, PORT)
+        ensure_indexes(_client.daisho)
+    return _client.daisho
+
+
+def ensure_indexes(daisho_db):
+    """
+    Create the indexes the priority views sort on,
+    and rank items added before they existed.
+    """
+    for collection in COLLECTIONS.values():
+        daisho_db[collection].create_index(
+            [
+                ("tenant", pymongo.ASCENDING),
+                ("prio", pymongo.DESCENDING),
+                ("urgency", pymongo.ASCENDING),
+            ]
+        )
+        daisho_db[collection].create_index(
+            [("tenant", pymongo.ASCENDING), ("urgency", pymongo.ASCENDING)]
+        )
+        # For paging through a user's items in `_id` order.
+        daisho_db[collection].create_index(
+            [("tenant", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]
+        )
+        for document in daisho_db[collection].find({"urgency": {"$exists": False}}):
+            daisho_db[collection].update_one(
+                {"_id": document["_id"]}, {"$set": documents.rank(document)}
+            )
+    # Only recurring tasks have `starts`.
+    daisho_db[COLLECTIONS["task"]].create_index(
+        [("tenant", pymongo.ASCENDING), ("starts", pymongo.ASCENDING)],
+        partialFilterExpression={"starts": {"$exists": True}},
+    )
+    daisho_db[REVISIONS].create_index(
+        [("item", pymongo.ASCENDING), ("rev", pymongo.ASCENDING)], unique=True
+    )
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def count_items(tenant):
+    """
+    The number of tasks and notes `tenant` has; an index count.
+    """
+    daisho_db = mongo_conn()
+    return sum(
+        daisho_db[collection].count_documents({"tenant": tenant})
+        for collection in COLLECTIONS.values()
+    )
+
+
+def add_item(kind, fields, tenant=None, max_items=None):
+    """
+    Insert a task or note, and return the stored document.
+    A recurring task with no date starts today.
+    Raises QuotaExceeded if `tenant` already has `max_items` items.
+    """
+    if max_items is not None and count_items(tenant) >= max_items:
+        raise QuotaExceeded(
+            "The limit of {} tasks and notes is reached".format(max_items)
+        )
+    document = dict(fields)
+    if tenant is not None:
+        document["tenant"] = tenant
+    if document.get("repeat"):
+        recur.parse(document["repeat"])
+        if not document.get("date"):
+            document["date"] = datetime.date.today().strftime(recur.DATE_FORMAT)
+    else:
+        document.pop("repeat", None)
+    document.update(documents.rank(document))
+    result = mongo_conn()[COLLECTIONS[kind]].insert_one(document)
+    document["_id"] = result.inserted_id
+    return document
+
+
+class EditConflict(Exception):
+    pass
+
+
+def edit_item(kind, item_id, rev, changes, tenant=None):
+    """
+    Set the fields in `changes` on the item, which must still be at
+    revision `rev`, and log the edit. Return the stored document.
+    Only the changed fields, and the rank if it changed, are written.
+    """
+    daisho_db = mongo_conn()
+    collection = daisho_db[COLLECTIONS[kind]]
+    item_id = bson.ObjectId(item_id)
+    old = collection.find_one({"_id": item_id, "tenant": tenant})
+    if old is None:
+        raise ValueError("No {} with id `{}`".format(kind, item_id))
+    if old.get("rev", 0) != rev:
+        raise EditConflict(
+            "The {} was changed since revision {}; load it and edit again".format(
+                kind, rev
+            )
+        )
+    changes = {key: val for key, val in changes.items() if old.get(key) != val}
+    if not changes:
+        return old
+    if changes.get("repeat"):
+        recur.parse(changes["repeat"])
+
+    new = dict(old, **changes)
+    update = dict(changes, rev=rev + 1)
+    if {"priority", "date", "repeat"} & set(changes):
+        update.update(documents.rank(new))
+    # Completing a task doesn't bump `rev`, but changes the rank.
+    guard = {"rev": rev} if rev else {"rev": {"$exists": False}}
+    guard.update(
+        _id=item_id,
+        tenant=tenant,
+        done=old.get("done"),
+        done_until=old.get("done_until"),
+    )
+    result = collection.update_one(guard, {"$set": update})
+    if not result.matched_count:
+        raise EditConflict("The {} was changed by another edit".format(kind))
+
+    revisions = [history.make_revision(rev + 1, old, new)]
+    if rev == 0:
+        revisions.insert(0, history.make_revision(0, {}, old))
+    for revision in revisions:
+        revision.update(item=item_id, kind=kind)
+        daisho_db[REVISIONS].insert_one(revision)
+    return dict(old, **update)
+
+
+def complete_task(item_id, date=None, tenant=None):
+    """
+    Mark the task done on `date`, by default on its first occurrence
+    that is not done yet, and return the stored document.
+    """
+    tasks = mongo_conn()[COLLECTIONS["task"]]
+    document = tasks.find_one({"_id": bson.ObjectId(item_id), "tenant": tenant})
+    if document is None:
+        raise ValueError("No task with id `{}`".format(item_id))
+    day = recur.to_date(date) if date else recur.next_due(document)
+    if day is None or not any(recur.pending(document, day, day)):
+        raise ValueError(
+            "The task is not due on {}".format(date) if date else "The task is done"
+        )
+    changes = recur.complete(document, day)
+    changes.update(documents.rank(dict(document, **changes)))
+    guard = {
+        "_id": document["_id"],
+        "tenant": tenant,
+        "done": document.get("done"),
+        "done_until": document.get("done_until"),
+    }
+    if not tasks.update_one(guard, {"$set": changes}).matched_count:
+        raise EditConflict("The task was changed by another edit; try again")
+    return dict(document, **changes)
+
+
+def get_revision(kind, item_id, rev, tenant=None):
+    """
+    The item as it was at revision `rev`, or None if it has no such
+    revision. At most `history.SNAPSHOT_EVERY` revisions are read.
+    """
+    daisho_db = mongo_conn()
+    item_id = bson.ObjectId(item_id)
+    current = daisho_db[COLLECTIONS[kind]].find_one(
+        {"_id": item_id, "tenant": tenant}
+    )
+    if current is None or not 0 <= rev <= current.get("rev", 0):
+        return None
+    if rev == current.get("rev", 0):
+        return current
+    base = rev - rev % history.SNAPSHOT_EVERY
+    revisions = list(
+        daisho_db[REVISIONS]
+        .find({"item": item_id, "rev": {"$gte": base, "$lte": rev}})
+        .sort("rev", pymongo.ASCENDING)
+    )
+    if not revisions or "snapshot" not in revisions[0]:
+        return None
+    document = history.rebuild(revisions)
+    document.update(documents.rank(document), _id=item_id, rev=rev)
+    return document
+
+
+def page_items(kind, first, after=None, filters=None, tenant=None):
+    """
+    Return up to `first` items matching `filters`, in `_id` order, that
+    come after the `_id` given in `after`, whether there are more, and
+    the `_id` to continue after.
+    This is a range scan on the `_id` index; no documents are skipped.
+    With a `date` filter, the scan also skips recurring tasks that
+    don't occur on the date, and stops after `MAX_SCAN` documents: the
+    page may then be short, or empty, but the next one continues from
+    the last document read.
+    """
+    filters = filters or {}
+    date = filters.get("date")
+    query = documents.item_filter(filters)
+    query["tenant"] = tenant
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    cursor = mongo_conn()[COLLECTIONS[kind]].find(query).sort("_id", pymongo.ASCENDING)
+    cursor = cursor.limit(max(first + 1, MAX_SCAN) if date else first + 1)
+    items = []
+    scanned = 0
+    last = after
+    for item in cursor:
+        scanned += 1
+        if documents.on_date(item, date):
+            items.append(item)
+            if len(items) > first:
+                break
+        last = item["_id"]
+    if len(items) > first:
+        return items[:first], True, items[first - 1]["_id"] if first else after
+    return items, bool(date) and scanned == MAX_SCAN, last
+
+
+def top_items(kind, first, by="prio", priority=None, tenant=None):
+    """
+    The first `first` items, by priority and then urgency, or by
+    urgency alone if `by` is `urgency`. Both orders are index scans.
+    """
+    query = {"tenant": tenant}
+    if priority:
+        query["prio"] = documents.to_prio(priority)
+    if by == "prio":
+        order = [("prio", pymongo.DESCENDING), ("urgency", pymongo.ASCENDING)]
+    else:
+        order = [("urgency", pymongo.ASCENDING)]
+    return list(mongo_conn()[COLLECTIONS[kind]].find(query).sort(order).limit(first))
+
+
+def iter_items(kind, batch_size=500, tenant=None):
+    """
+    Yield every item, in `_id` order, fetching `batch_size` at a time.
+    """
+    cursor = (
+        mongo_conn()[COLLECTIONS[kind]]
+        .find({"tenant": tenant})
+        .sort("_id", pymongo.ASCENDING)
+        .batch_size(batch_size)
+    )
+    for document in cursor:
+        yield document
+
+
+def close_conn():
+    """
+    Close the client, if one was opened.
+    """
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
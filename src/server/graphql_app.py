@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+"""
+The `/graphql` endpoint.
+
+Besides a single `{"query": ..., "variables": ...}` body, this accepts:
+
+* A JSON list of operations, executed in order and answered with a
+  list of results in one response.
+* Persisted queries: an operation may carry only
+  `extensions.persistedQuery.sha256Hash`. If the hash is unknown, the
+  result is a `PersistedQueryNotFound` error and the client resends the
+  operation with the full query text, which is then remembered.
+* A gzip compressed request body (`Content-Encoding: gzip`).
+  Bodies are decompressed as they are read, and rejected with a 413
+  once they exceed `limits.MAX_BODY_SIZE`.
+* `GET /graphql?query=...&variables=...` for queries.
+
+Operations deeper or more expensive than `limits.py` allows are
+rejected before execution. A batch may hold at most `limits.MAX_BATCH`
+operations, and their costs together may not exceed `limits.MAX_COST`.
+
+Operations run as the user the request was authenticated as (see
+`tenants.py`), who is passed to resolvers as `info.context["user"]`.
+
+Query results are cached per user (see `cache.py`). A single operation's
+response carries an `ETag`, and a request whose `If-None-Match`
+matches it is answered with a 304 without running the query.
+"""
+
+import collections
+import functools
+import hashlib
+import json
+import logging
+import zlib
+
+from graphql import parse
+from graphql.error import format_error as format_graphql_error
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+
+import limits
+import tenants
+from cache import cache, not_modified
+
+PERSISTED_QUERIES = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class GraphQLEndpoint(object):
+    def __init__(self, schema):
+        self.schema = schema
+        # Run in the thread pool; replaced when profiling, see profiling.py
+        self.execute_sync = schema.execute
+        self.persisted = collections.OrderedDict()
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive=receive)
+        response = await self.handle(request)
+        await response(scope, receive, send)
+
+    async def handle(self, request):
+        user = request.scope.get("user", tenants.ANONYMOUS)
+        if request.method == "GET":
+            operation = dict(request.query_params)
+            try:
+                for key in ("variables", "extensions"):
+                    if key in operation:
+                        operation[key] = json.loads(operation[key])
+            except ValueError:
+                return PlainTextResponse("Invalid JSON parameter", status_code=400)
+            return await self.respond(request, operation, user, allow_mutation=False)
+
+        if request.method != "POST":
+            return PlainTextResponse("Method Not Allowed", status_code=405)
+        try:
+            body = await _read_body(request)
+        except BadBody as err:
+            return PlainTextResponse(err.args[0], status_code=err.status)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return PlainTextResponse("Invalid JSON body", status_code=400)
+
+        if isinstance(data, list):
+            if len(data) > limits.MAX_BATCH:
+                return _too_complex(
+                    "Batch of {} operations exceeds the limit of {}".format(
+                        len(data), limits.MAX_BATCH
+                    )
+                )
+            cost = sum(self.cost(operation) for operation in data)
+            if cost > limits.MAX_COST:
+                return _too_complex(
+                    "Batch cost {} exceeds the limit of {}".format(
+                        cost, limits.MAX_COST
+                    )
+                )
+            results = []
+            for operation in data:
+                body, _ = await self.execute(operation, user)
+                results.append(json.loads(body))
+            return JSONResponse(results)
+        return await self.respond(request, data, user)
+
+    async def respond(self, request, operation, user, allow_mutation=True):
+        """
+        Answer a single operation, with an ETag if it is cacheable.
+        """
+        tag = self.etag(operation, user)
+        if tag is not None and _operation_type(*tag[1]) == "query":
+            response = not_modified(request, tag[0])
+            if response is not None:
+                return response
+        body, tag = await self.execute(operation, user, allow_mutation=allow_mutation)
+        headers = {"ETag": tag} if tag is not None else None
+        return Response(body, media_type="application/json", headers=headers)
+
+    def lookup(self, operation):
+        """
+        Return the query text for `operation`, or None if it only
+        carries a hash we have not seen.
+        """
+        query = operation.get("query")
+        extensions = operation.get("extensions") or {}
+        persisted = extensions.get("persistedQuery")
+        if not persisted:
+            return query
+        digest = persisted.get("sha256Hash")
+        if query is None:
+            query = self.persisted.get(digest)
+            if query is not None:
+                self.persisted.move_to_end(digest)
+            return query
+        if hashlib.sha256(query.encode("utf-8")).hexdigest() != digest:
+            raise ValueError("provided sha does not match query")
+        self.persisted[digest] = query
+        if len(self.persisted) > PERSISTED_QUERIES:
+            self.persisted.popitem(last=False)
+        return query
+
+    def cost(self, operation):
+        """
+        The cost of `operation`, or 0 if it will fail before it is run.
+        """
+        if not isinstance(operation, dict):
+            return 0
+        try:
+            query = self.lookup(operation)
+            if query is None:
+                return 0
+            return limits.check_query(
+                _parse(query),
+                operation.get("operationName"),
+                operation.get("variables"),
+            )
+        except Exception:
+            # Reported when the operation is executed.
+            return 0
+
+    def etag(self, operation, user):
+        """
+        Return the ETag of `operation` and its (query, operationName).
+        """
+        if not isinstance(operation, dict):
+            return None
+        try:
+            query = self.lookup(operation)
+        except ValueError:
+            return None
+        if query is None:
+            return None
+        operation_name = operation.get("operationName")
+        tag = cache.etag(
+            query, operation.get("variables"), operation_name, tenant=user.name
+        )
+        return tag, (query, operation_name)
+
+    async def execute(self, operation, user, allow_mutation=True):
+        """
+        Return the serialized result of `operation`, and its ETag
+        if the result came from, or was stored in, the cache.
+        """
+        if not isinstance(operation, dict):
+            return _error("Operation must be a JSON object"), None
+        try:
+            query = self.lookup(operation)
+        except ValueError as err:
+            return _error(str(err)), None
+        if query is None:
+            return _error("PersistedQueryNotFound"), None
+
+        variables = operation.get("variables")
+        operation_name = operation.get("operationName")
+        tag = cache.etag(query, variables, operation_name, tenant=user.name)
+        body = cache.get(tag)
+        if body is not None:
+            return body, tag
+
+        op_type = _operation_type(query, operation_name)
+        if op_type == "mutation" and not allow_mutation:
+            return _error("Mutations must be sent with POST"), None
+        if op_type is not None:
+            try:
+                limits.check_query(_parse(query), operation_name, variables)
+            except limits.QueryTooComplex as err:
+                return _error(str(err)), None
+
+        result = await run_in_threadpool(
+            self.execute_sync,
+            query,
+            variables=variables,
+            operation_name=operation_name,
+            context_value={"user": user},
+        )
+        response = {"data": result.data}
+        if result.errors:
+            response["errors"] = [format_graphql_error(err) for err in result.errors]
+        body = json.dumps(response).encode("utf-8")
+        if op_type != "query" or result.errors:
+            return body, None
+        cache.put(tag, body)
+        return body, tag
+
+
+class BadBody(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+async def _read_body(request):
+    """
+    Read the request body, decompressing it if it is gzip compressed.
+    Raise BadBody if it is too large, or not valid gzip.
+    """
+    decompressor = None
+    if request.headers.get("content-encoding") == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    body = bytearray()
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if decompressor is not None:
+            try:
+                # At most one byte more than the limit, to detect it.
+                chunk = decompressor.decompress(
+                    chunk, limits.MAX_BODY_SIZE + 1 - len(body)
+                )
+            except zlib.error:
+                raise BadBody("Invalid gzip body")
+        body += chunk
+        if len(body) > limits.MAX_BODY_SIZE or received > limits.MAX_BODY_SIZE:
+            raise BadBody("Request body too large", status=413)
+    if decompressor is not None and not decompressor.eof:
+        raise BadBody("Invalid gzip body")
+    return bytes(body)
+
+
+def _too_complex(message):
+    return JSONResponse({"errors": [{"message": message}]}, status_code=400)
+
+
+def _error(message):
+    return json.dumps({"errors": [{"message": message}]}).encode("utf-8")
+
+
+@functools.lru_cache(maxsize=PERSISTED_QUERIES)
+def _parse(query):
+    return parse(query)
+
+
+@functools.lru_cache(maxsize=PERSISTED_QUERIES)
+def _operation_type(query, operation_name):
+    """
+    Return `query`, `mutation` or `subscription`, or None if
+    the operation can not be found.
+    """
+    try:
+        document = _parse(query)
+    except Exception:
+        return None
+    for definition in document.definitions:
+        if not hasattr(definition, "operation"):
+            continue
+        name = definition.name.value if definition.name else None
+        if operation_name is None or name == operation_name:
+            return getattr(definition.operation, "value", definition.operation)
+    return None
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""
+Depth and cost analysis of GraphQL queries, and the other limits on a
+request to `/graphql`.
+
+Depth and cost are computed from the parsed query before it is executed.
+Each field costs 1, times the page size of every connection it is
+nested in; a connection's page size is its `first` argument, or
+`PAGE_SIZE` if that is not given.
+"""
+
+MAX_DEPTH = 8
+# Of an operation, or of all the operations in a batched request.
+MAX_COST = 5000
+MAX_BATCH = 20
+# Of a request body, in bytes, once decompressed.
+MAX_BODY_SIZE = 1024 * 1024
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+CONNECTIONS = ("tasks", "notes", "tasksByPriority", "notesByPriority", "nextTasks")
+
+
+class QueryTooComplex(Exception):
+    pass
+
+
+def check_query(document, operation_name=None, variables=None):
+    """
+    Raise QueryTooComplex if the operation in `document` is too deep,
+    or too expensive. Returns its cost.
+    """
+    fragments = {}
+    operations = []
+    for definition in document.definitions:
+        if _node_type(definition) == "FragmentDefinition":
+            fragments[definition.name.value] = definition
+        elif hasattr(definition, "operation"):
+            name = definition.name.value if definition.name else None
+            if operation_name is None or name == operation_name:
+                operations.append(definition)
+
+    total = 0
+    for operation in operations:
+        depth, cost = _walk(operation.selection_set, fragments, variables or {}, 1)
+        if depth > MAX_DEPTH:
+            raise QueryTooComplex(
+                "Query depth {} exceeds the limit of {}".format(depth, MAX_DEPTH)
+            )
+        if cost > MAX_COST:
+            raise QueryTooComplex(
+                "Query cost {} exceeds the limit of {}".format(cost, MAX_COST)
+            )
+        total += cost
+    return total
+
+
+def _walk(selection_set, fragments, variables, multiplier, seen=()):
+    """
+    Return the depth and cost of `selection_set`.
+    """
+    depth, cost = 0, 0
+    for selection in selection_set.selections:
+        node_type = _node_type(selection)
+        if node_type == "Field":
+            cost += multiplier
+            if selection.selection_set is None:
+                depth = max(depth, 1)
+                continue
+            size = _page_size(selection, variables)
+            child_depth, child_cost = _walk(
+                selection.selection_set,
+                fragments,
+                variables,
+                multiplier * size if size else multiplier,
+                seen,
+            )
+            depth = max(depth, child_depth + 1)
+            cost += child_cost
+        elif node_type == "FragmentSpread":
+            name = selection.name.value
+            # Cyclic fragments are rejected by validation; don't loop on them.
+            if name in seen or name not in fragments:
+                continue
+            child_depth, child_cost = _walk(
+                fragments[name].selection_set,
+                fragments,
+                variables,
+                multiplier,
+                seen + (name,),
+            )
+            depth = max(depth, child_depth)
+            cost += child_cost
+        elif node_type == "InlineFragment":
+            child_depth, child_cost = _walk(
+                selection.selection_set, fragments, variables, multiplier, seen
+            )
+            depth = max(depth, child_depth)
+            cost += child_cost
+    return depth, cost
+
+
+def _page_size(field, variables):
+    for argument in field.arguments or []:
+        if argument.name.value != "first":
+            continue
+        value = argument.value
+        if _node_type(value) == "Variable":
+            size = variables.get(value.name.value)
+        else:
+            size = getattr(value, "value", None)
+        try:
+            return int(size)
+        except (TypeError, ValueError):
+            return PAGE_SIZE
+    if field.name.value in CONNECTIONS:
+        return PAGE_SIZE
+    return None
+
+
+def _node_type(node):
+    # graphql-core 3 names its AST classes `FieldNode`, etc.
+    name = type(node).__name__
+    if name.endswith("Node"):
+        name = name[: -len("Node")]
+    return name
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+"""
+Load generator for the Daisho GraphQL API.
+
+    ./loadgen.py --local --concurrency 50 --duration 30
+    ./loadgen.py --url http://127.0.0.1:8000/graphql --mix add=1,list=6,find=3
+    ./loadgen.py --token TOKEN   # as a user of a server with `--users`
+
+Each of `--concurrency` clients keeps one HTTP/1.1 connection open and
+sends add / list / find operations, picked at random in the ratio given
+by `--mix`. At the end, the throughput and the p50 / p99 latency of
+each operation are printed.
+
+`--local` starts a `daisho-server --store memory` to run against, so
+no MongoDB is needed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ADD_TASK = """
+mutation AddTask($subject: String!, $tags: [String], $priority: String) {
+  addTask(subject: $subject, tags: $tags, priority: $priority) { task { id } }
+}
+"""
+
+LIST_TASKS = """
+query List($tag: String) {
+  tasks(first: 20, tag: $tag) {
+    edges { node { id subject tags priority } }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+"""
+
+FIND_TASKS = """
+query Find($search: String) {
+  tasks(first: 20, search: $search) { edges { node { id subject } } }
+}
+"""
+
+WORDS = ["rent", "groceries", "report", "dentist", "backup", "review", "invoice"]
+TAGS = ["home", "work", "bills", "health"]
+PRIORITIES = ["#high", "#med", "#low"]
+
+
+def make_operation(name):
+    if name == "add":
+        variables = {
+            "subject": "{} {}".format(random.choice(WORDS), random.randint(1, 10000)),
+            "tags": random.sample(TAGS, 2),
+            "priority": random.choice(PRIORITIES),
+        }
+        return {"query": ADD_TASK, "variables": variables}
+    if name == "list":
+        return {"query": LIST_TASKS, "variables": {"tag": random.choice(TAGS)}}
+    return {"query": FIND_TASKS, "variables": {"search": random.choice(WORDS)}}
+
+
+class Connection(object):
+    """
+    A minimal keep-alive HTTP/1.1 client, for JSON POSTs.
+    """
+
+    def __init__(self, host, port, path, token=None):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.auth = "Authorization: Bearer {}\r\n".format(token) if token else ""
+        self.reader = None
+        self.writer = None
+
+    async def post(self, payload):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        body = json.dumps(payload).encode("utf-8")
+        head = (
+            "POST {} HTTP/1.1\r\n"
+            "Host: {}:{}\r\n"
+            "Content-Type: application/json\r\n"
+            "{}"
+            "Content-Length: {}\r\n\r\n"
+        ).format(self.path, self.host, self.port, self.auth, len(body))
+        self.writer.write(head.encode("ascii") + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        data = await self.reader.readexactly(length)
+        return status, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def client(url, mix, deadline, latencies, errors, token=None):
+    parsed = urllib.parse.urlsplit(url)
+    conn = Connection(
+        parsed.hostname, parsed.port or 80, parsed.path or "/graphql", token
+    )
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    try:
+        while time.monotonic() < deadline:
+            name = random.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                status, data = await conn.post(make_operation(name))
+            except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                errors[name] = errors.get(name, 0) + 1
+                conn.close()
+                conn.writer = None
+                continue
+            elapsed = time.perf_counter() - start
+            if status != 200 or b'"errors"' in data:
+                errors[name] = errors.get(name, 0) + 1
+            else:
+                latencies[name].append(elapsed)
+    finally:
+        conn.close()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def report(latencies, errors, elapsed):
+    total = sum(len(values) for values in latencies.values())
+    print(
+        "\n{} requests in {:.1f}s, {:.1f} req/s, {} errors\n".format(
+            total, elapsed, total / elapsed, sum(errors.values())
+        )
+    )
+    row = "{:<6} {:>8} {:>10} {:>10} {:>7}"
+    print(row.format("op", "count", "p50 ms", "p99 ms", "errors"))
+    everything = []
+    for name, values in sorted(latencies.items()):
+        everything.extend(values)
+        values.sort()
+        if not values:
+            continue
+        print(
+            "{:<6} {:>8} {:>10.2f} {:>10.2f} {:>7}".format(
+                name,
+                len(values),
+                percentile(values, 0.50) * 1000,
+                percentile(values, 0.99) * 1000,
+                errors.get(name, 0),
+            )
+        )
+    if everything:
+        everything.sort()
+        print(
+            "{:<6} {:>8} {:>10.2f} {:>10.2f} {:>7}".format(
+                "all",
+                len(everything),
+                percentile(everything, 0.50) * 1000,
+                percentile(everything, 0.99) * 1000,
+                sum(errors.values()),
+            )
+        )
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("add", "list", "find"):
+            raise argparse.ArgumentTypeError("unknown operation `{}`".format(name))
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def start_local_server(port):
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(HERE, "serve.py"),
+            "--store",
+            "memory",
+            "--port",
+            str(port),
+            "--no-access-log",
+        ]
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("daisho-server did not start on port {}".format(port))
+
+
+async def run(url, mix, concurrency, duration, token=None):
+    latencies = {name: [] for name in mix}
+    errors = {}
+    start = time.monotonic()
+    deadline = start + duration
+    await asyncio.gather(
+        *[
+            client(url, mix, deadline, latencies, errors, token)
+            for _ in range(concurrency)
+        ]
+    )
+    report(latencies, errors, time.monotonic() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load generator for the Daisho GraphQL API"
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8000/graphql")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=parse_mix("add=1,list=6,find=3"),
+        help="operation weights (default: add=1,list=6,find=3)",
+    )
+    parser.add_argument("--token", help="the user's token, for a server with users")
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="start a daisho-server with the in-memory store, and use it",
+    )
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.local:
+        port = urllib.parse.urlsplit(args.url).port or 8000
+        server = start_local_server(port)
+    try:
+        asyncio.run(
+            run(args.url, args.mix, args.concurrency, args.duration, args.token)
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
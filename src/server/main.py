@@ -1,18 +1,136 @@
 #!/usr/bin/env python3
 
+import asyncio
+import json
+import os
+import threading
+
 import graphene
-from fastapi import FastAPI
-from starlette.graphql import GraphQLApp
+from fastapi import FastAPI, Request, WebSocket
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.websockets import WebSocketDisconnect
 
-from schema import Query
+import broker
+import database
+import profiling
+import tenants
+from cache import cache, not_modified
+from graphql_app import GraphQLEndpoint
+from schema import Mutation, Query
 
 app = FastAPI(
     title="Daisho API", description="Daisho GraphQL FastAPI interface", version="0.1"
 )
 
-app.add_route("/graphql", GraphQLApp(schema=graphene.Schema(query=Query)))
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Outside the gzip middleware, so rejected requests are cheap.
+app.add_middleware(
+    tenants.TenantMiddleware, users=tenants.Users(os.environ.get("DAISHO_USERS"))
+)
+graphql_endpoint = GraphQLEndpoint(
+    schema=graphene.Schema(query=Query, mutation=Mutation)
+)
+app.add_route("/graphql", graphql_endpoint)
+
+if os.environ.get("DAISHO_PROFILE"):
+    profiling.install(app, graphql_endpoint, os.environ["DAISHO_PROFILE"])
+
+_watch_stop = threading.Event()
+
+
+@app.on_event("startup")
+async def start_change_stream():
+    loop = asyncio.get_event_loop()
+    broker.feed.loop = loop
+    if database.STORE == "mongo":
+        loop.run_in_executor(None, broker.watch_mongo, _watch_stop)
+
+
+@app.on_event("shutdown")
+async def stop_change_stream():
+    _watch_stop.set()
+    database.close_conn()
 
 
 @app.get("/api")
-def hello():
-    return "Hello, I am FastAPI"
+def hello(request: Request):
+    tag = cache.etag("/api")
+    response = not_modified(request, tag)
+    if response is not None:
+        return response
+    return JSONResponse("Hello, I am FastAPI", headers={"ETag": tag})
+
+
+@app.get("/export/{kind}")
+def export(kind: str, request: Request):
+    """
+    Stream every task or note of the user as newline delimited JSON.
+    """
+    if kind not in ("tasks", "notes"):
+        return JSONResponse({"detail": "Not Found"}, status_code=404)
+    tenant = request.scope["user"].name
+    items = database.iter_items(kind[:-1], tenant=tenant)
+    lines = (json.dumps(item, default=str) + "\n" for item in items)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+@app.websocket("/graphql/ws")
+async def subscriptions(websocket: WebSocket):
+    """
+    Live task and note changes, using the `graphql-ws` message types.
+
+        -> {"type": "connection_init"}
+        <- {"type": "connection_ack"}
+        -> {"type": "start", "id": "1", "payload": {"variables": {"kinds": ["task"]}}}
+        <- {"type": "data", "id": "1", "payload": {"data": {"changes": [...]}}}
+        <- {"type": "data", "id": "1", "payload": {"data": {"resync": true}}}
+        -> {"type": "stop", "id": "1"}
+        <- {"type": "complete", "id": "1"}
+    """
+    await websocket.accept()
+    subscriber = None
+    sender = None
+    op_id = None
+    try:
+        while True:
+            message = await websocket.receive_json()
+            msg_type = message.get("type")
+            if msg_type == "connection_init":
+                await websocket.send_json({"type": "connection_ack"})
+            elif msg_type == "start" and subscriber is None:
+                op_id = message.get("id")
+                variables = (message.get("payload") or {}).get("variables") or {}
+                subscriber = broker.feed.subscribe(
+                    kinds=variables.get("kinds") or broker.KINDS,
+                    tenant=websocket.scope["user"].name,
+                )
+                sender = asyncio.ensure_future(
+                    _push_changes(websocket, op_id, subscriber)
+                )
+            elif msg_type in ("stop", "connection_terminate"):
+                break
+        if sender is not None:
+            sender.cancel()
+            sender = None
+        await websocket.send_json({"type": "complete", "id": op_id})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if sender is not None:
+            sender.cancel()
+        if subscriber is not None:
+            broker.feed.unsubscribe(subscriber)
+
+
+async def _push_changes(websocket, op_id, subscriber):
+    while True:
+        events = await subscriber.get()
+        if events is None:
+            data = {"resync": True}
+        else:
+            data = {"changes": events}
+        message = {"type": "data", "id": op_id, "payload": {"data": data}}
+        await websocket.send_text(json.dumps(message, default=str))
+
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+"""
+An in-memory stand-in for the `daisho` MongoDB db.
+
+Used with `daisho-server --store memory`, for load tests and local
+runs without a `mongod`. It implements only the parts of the pymongo
+API that `database.py` uses, with the same semantics for the query
+operators listed in `OPERATORS`. Each server process has its own,
+unshared, copy of the data.
+"""
+
+import copy
+import functools
+import heapq
+import re
+import threading
+
+import bson
+import pymongo
+from pymongo.results import DeleteResult, InsertOneResult, UpdateResult
+
+
+class MemoryCursor(object):
+    def __init__(self, documents):
+        self.documents = documents
+        self.order = []
+        self.count = None
+
+    def sort(self, key, direction=pymongo.ASCENDING):
+        self.order = key if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def limit(self, count):
+        self.count = count or None
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __iter__(self):
+        documents = self.documents
+        if self.order:
+            key = functools.cmp_to_key(self._compare)
+            if self.count is not None:
+                # Top-k with a heap, instead of sorting everything.
+                documents = heapq.nsmallest(self.count, documents, key=key)
+            else:
+                documents = sorted(documents, key=key)
+        elif self.count is not None:
+            documents = documents[: self.count]
+        for document in documents:
+            yield copy.deepcopy(document)
+
+    def _compare(self, one, other):
+        for field, direction in self.order:
+            a, b = _sort_key(one.get(field)), _sort_key(other.get(field))
+            if a != b:
+                result = -1 if a < b else 1
+                return result if direction == pymongo.ASCENDING else -result
+        return 0
+
+
+class MemoryCollection(object):
+    def __init__(self):
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def insert_one(self, document):
+        document.setdefault("_id", bson.ObjectId())
+        with self.lock:
+            self.documents[document["_id"]] = copy.deepcopy(document)
+        return InsertOneResult(document["_id"], True)
+
+    def find(self, query=None, projection=None):
+        with self.lock:
+            documents = [
+                doc for doc in self.documents.values() if matches(doc, query or {})
+            ]
+        return MemoryCursor(documents)
+
+    def find_one(self, query=None, projection=None):
+        for document in self.find(query).limit(1):
+            return document
+        return None
+
+    def count_documents(self, query):
+        return len(self.find(query).documents)
+
+    def update_one(self, query, update, upsert=False):
+        with self.lock:
+            for document in self.documents.values():
+                if matches(document, query):
+                    apply_update(document, update)
+                    return UpdateResult({"n": 1, "nModified": 1}, True)
+        if upsert:
+            document = {k: v for k, v in query.items() if not k.startswith("$")}
+            apply_update(document, update)
+            self.insert_one(document)
+        return UpdateResult({"n": 0, "nModified": 0}, True)
+
+    def delete_one(self, query):
+        with self.lock:
+            for item_id, document in list(self.documents.items()):
+                if matches(document, query):
+                    del self.documents[item_id]
+                    return DeleteResult({"n": 1}, True)
+        return DeleteResult({"n": 0}, True)
+
+    def create_index(self, keys, **kwargs):
+        return "_".join("{}_{}".format(field, order) for field, order in keys)
+
+
+class MemoryDatabase(object):
+    def __init__(self):
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self.lock:
+            if name not in self.collections:
+                self.collections[name] = MemoryCollection()
+            return self.collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+def matches(document, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(document, sub) for sub in condition):
+                return False
+        elif not _match_field(document.get(key), condition):
+            return False
+    return True
+
+
+def _match_field(value, condition):
+    if not (isinstance(condition, dict) and condition and _is_operators(condition)):
+        if isinstance(value, list) and not isinstance(condition, list):
+            return condition in value
+        return value == condition
+    for operator, operand in condition.items():
+        if operator == "$options":
+            continue
+        if operator == "$regex":
+            flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+            values = value if isinstance(value, list) else [value]
+            if not any(
+                isinstance(v, str) and re.search(operand, v, flags) for v in values
+            ):
+                return False
+        elif not OPERATORS[operator](value, operand):
+            return False
+    return True
+
+
+def _is_operators(condition):
+    return all(key.startswith("$") for key in condition)
+
+
+def _compare(test):
+    def compare(value, operand):
+        return value is not None and test(value, operand)
+
+    return compare
+
+
+OPERATORS = {
+    "$gt": _compare(lambda a, b: a > b),
+    "$gte": _compare(lambda a, b: a >= b),
+    "$lt": _compare(lambda a, b: a < b),
+    "$lte": _compare(lambda a, b: a <= b),
+    "$ne": lambda a, b: a != b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+    "$exists": lambda a, b: (a is not None) == b,
+}
+
+
+def apply_update(document, update):
+    for field, value in update.get("$set", {}).items():
+        document[field] = copy.deepcopy(value)
+    for field in update.get("$unset", {}):
+        document.pop(field, None)
+    for field, value in update.get("$inc", {}).items():
+        document[field] = document.get(field, 0) + value
+    for field, value in update.get("$push", {}).items():
+        document.setdefault(field, []).append(copy.deepcopy(value))
+
+
+def _sort_key(value):
+    # Sort missing values first, as MongoDB does.
+    return (value is not None, value if value is not None else 0)
+
+
+database = MemoryDatabase()
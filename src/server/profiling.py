@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+"""
+Per-request profiling, enabled by starting the server with `--profile`
+(which sets `DAISHO_PROFILE` to the output directory).
+
+When it is off, nothing here is installed, and requests take exactly
+the same path as before.
+
+Each profiled request gets a `.prof` file, and its hottest functions are
+logged. cProfile can only have one active profiler at a time, so a
+request that arrives while another is being profiled runs unprofiled.
+Work done in the thread pool on behalf of the profiled request (GraphQL
+execution, see `call()`) is included in its profile.
+"""
+
+import contextvars
+import cProfile
+import functools
+import io
+import itertools
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+
+TOP_N = 15
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("daisho_profile", default=None)
+_lock = threading.Lock()
+_count = itertools.count(1)
+
+
+class ProfilerMiddleware(object):
+    def __init__(self, app, directory, top=TOP_N):
+        self.app = app
+        self.directory = directory
+        self.top = top
+        os.makedirs(directory, exist_ok=True)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profiles = []
+        profile = cProfile.Profile()
+        token = _current.set(profiles)
+        try:
+            profile.enable()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                profile.disable()
+        finally:
+            _current.reset(token)
+            _lock.release()
+        self.report(scope, [profile] + profiles)
+
+    def report(self, scope, profiles):
+        name = "{} {}".format(scope["method"], scope["path"])
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")[:40]
+        path = os.path.join(
+            self.directory,
+            "{}-{:04d}-{}.prof".format(
+                time.strftime("%Y%m%d-%H%M%S"), next(_count), slug
+            ),
+        )
+        stream = io.StringIO()
+        stats = pstats.Stats(*profiles, stream=stream)
+        stats.dump_stats(path)
+        stats.sort_stats("cumulative").print_stats(self.top)
+        logger.info("Profile for `%s` written to %s\n%s", name, path, stream.getvalue())
+
+
+def call(func, *args, **kwargs):
+    """
+    Call `func` in a worker thread, profiling it as part of
+    the current request if that is being profiled.
+    """
+    profiles = _current.get()
+    if profiles is None:
+        return func(*args, **kwargs)
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Python 3.12+ profiles every thread from the request's profiler.
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.disable()
+        profiles.append(profile)
+
+
+def install(app, endpoint, directory):
+    """
+    Profile every request to `app`, including the GraphQL
+    execution done by `endpoint` in the thread pool.
+    """
+    app.add_middleware(ProfilerMiddleware, directory=directory)
+    endpoint.execute_sync = functools.partial(call, endpoint.execute_sync)
@@ -1,11 +1,318 @@
 #!/usr/bin/env python3
 
+import base64
+
+import bson
 import graphene
 
+import broker
+import database
+import limits
+import tenants
+
+
+class Task(graphene.ObjectType):
+    id = graphene.ID()
+    subject = graphene.String()
+    date = graphene.String()
+    tags = graphene.List(graphene.String)
+    priority = graphene.String()
+    prio = graphene.Int()
+    urgency = graphene.Int()
+    rev = graphene.Int()
+    repeat = graphene.String()
+    done = graphene.List(graphene.String)
+    done_until = graphene.String()
+
+    @staticmethod
+    def resolve_id(parent, info):
+        return str(parent["_id"])
+
+
+class Note(graphene.ObjectType):
+    id = graphene.ID()
+    subject = graphene.String()
+    date = graphene.String()
+    tags = graphene.List(graphene.String)
+    priority = graphene.String()
+    prio = graphene.Int()
+    urgency = graphene.Int()
+    rev = graphene.Int()
+    note = graphene.String()
+
+    @staticmethod
+    def resolve_id(parent, info):
+        return str(parent["_id"])
+
+
+class TaskConnection(graphene.relay.Connection):
+    class Meta:
+        node = Task
+
+
+class NoteConnection(graphene.relay.Connection):
+    class Meta:
+        node = Note
+
+
+def to_cursor(kind, item_id):
+    return base64.b64encode("{}:{}".format(kind, item_id).encode()).decode()
+
+
+def from_cursor(kind, cursor):
+    try:
+        prefix, item_id = base64.b64decode(cursor).decode().split(":", 1)
+        if prefix != kind:
+            raise ValueError
+        return bson.ObjectId(item_id)
+    except (ValueError, bson.errors.InvalidId):
+        raise ValueError("Invalid cursor `{}`".format(cursor))
+
+
+def _user(info):
+    """
+    The user making the request; see tenants.py.
+    """
+    return (info.context or {}).get("user", tenants.ANONYMOUS)
+
+
+def _top_k(first):
+    if first < 0 or first > limits.MAX_PAGE_SIZE:
+        raise ValueError(
+            "`first` must be between 0 and {}".format(limits.MAX_PAGE_SIZE)
+        )
+    return first
+
+
+def _page(kind, connection, first, after, filters, tenant):
+    _top_k(first)
+    if after is not None:
+        after = from_cursor(kind, after)
+    items, has_next, end = database.page_items(kind, first, after, filters, tenant)
+    edges = [
+        connection.Edge(node=item, cursor=to_cursor(kind, item["_id"]))
+        for item in items
+    ]
+    page_info = graphene.relay.PageInfo(
+        has_next_page=has_next,
+        has_previous_page=after is not None,
+        start_cursor=edges[0].cursor if edges else None,
+        # Past the last edge, if a date filter's scan stopped early.
+        end_cursor=to_cursor(kind, end)
+        if end is not None and (edges or has_next)
+        else None,
+    )
+    return connection(edges=edges, page_info=page_info)
+
 
 class Query(graphene.ObjectType):
     query = graphene.String(name=graphene.String())
+    tasks = graphene.Field(
+        TaskConnection,
+        first=graphene.Int(default_value=limits.PAGE_SIZE),
+        after=graphene.String(),
+        date=graphene.String(),
+        tag=graphene.String(),
+        priority=graphene.String(),
+        search=graphene.String(),
+    )
+    notes = graphene.Field(
+        NoteConnection,
+        first=graphene.Int(default_value=limits.PAGE_SIZE),
+        after=graphene.String(),
+        date=graphene.String(),
+        tag=graphene.String(),
+        priority=graphene.String(),
+        search=graphene.String(),
+    )
+
+    tasks_by_priority = graphene.List(
+        Task,
+        first=graphene.Int(default_value=limits.PAGE_SIZE),
+        priority=graphene.String(),
+    )
+    notes_by_priority = graphene.List(
+        Note,
+        first=graphene.Int(default_value=limits.PAGE_SIZE),
+        priority=graphene.String(),
+    )
+    next_tasks = graphene.List(Task, first=graphene.Int(default_value=5))
+
+    task_revision = graphene.Field(
+        Task, id=graphene.ID(required=True), rev=graphene.Int(required=True)
+    )
+    note_revision = graphene.Field(
+        Note, id=graphene.ID(required=True), rev=graphene.Int(required=True)
+    )
 
     @staticmethod
     def resolve_query(parent, info, name):
         return "Hello {}".format(name)
+
+    @staticmethod
+    def resolve_tasks(parent, info, first, after=None, **filters):
+        tenant = _user(info).name
+        return _page("task", TaskConnection, first, after, filters, tenant)
+
+    @staticmethod
+    def resolve_notes(parent, info, first, after=None, **filters):
+        tenant = _user(info).name
+        return _page("note", NoteConnection, first, after, filters, tenant)
+
+    @staticmethod
+    def resolve_tasks_by_priority(parent, info, first, priority=None):
+        return database.top_items(
+            "task", _top_k(first), priority=priority, tenant=_user(info).name
+        )
+
+    @staticmethod
+    def resolve_notes_by_priority(parent, info, first, priority=None):
+        return database.top_items(
+            "note", _top_k(first), priority=priority, tenant=_user(info).name
+        )
+
+    @staticmethod
+    def resolve_next_tasks(parent, info, first):
+        return database.top_items(
+            "task", _top_k(first), by="urgency", tenant=_user(info).name
+        )
+
+    @staticmethod
+    def resolve_task_revision(parent, info, id, rev):
+        return database.get_revision("task", _object_id(id), rev, _user(info).name)
+
+    @staticmethod
+    def resolve_note_revision(parent, info, id, rev):
+        return database.get_revision("note", _object_id(id), rev, _user(info).name)
+
+
+def _object_id(item_id):
+    try:
+        return bson.ObjectId(item_id)
+    except bson.errors.InvalidId:
+        raise ValueError("Invalid id `{}`".format(item_id))
+
+
+def _add(kind, fields, user):
+    try:
+        document = database.add_item(kind, fields, user.name, user.max_items)
+    except database.QuotaExceeded as err:
+        raise ValueError(str(err))
+    data = {k: v for k, v in document.items() if k != "_id"}
+    broker.feed.publish_threadsafe(kind, "insert", document["_id"], data)
+    return document
+
+
+def _edit(kind, item_id, rev, changes, tenant):
+    try:
+        document = database.edit_item(kind, _object_id(item_id), rev, changes, tenant)
+    except database.EditConflict as err:
+        raise ValueError(str(err))
+    data = {k: v for k, v in document.items() if k != "_id"}
+    broker.feed.publish_threadsafe(kind, "update", document["_id"], data)
+    return document
+
+
+class AddTask(graphene.Mutation):
+    class Arguments:
+        subject = graphene.String(required=True)
+        date = graphene.String()
+        tags = graphene.List(graphene.String)
+        priority = graphene.String()
+        repeat = graphene.String()
+
+    task = graphene.Field(Task)
+
+    @staticmethod
+    def mutate(parent, info, **fields):
+        return AddTask(task=_add("task", fields, _user(info)))
+
+
+class AddNote(graphene.Mutation):
+    class Arguments:
+        subject = graphene.String(required=True)
+        date = graphene.String()
+        tags = graphene.List(graphene.String)
+        priority = graphene.String()
+        note = graphene.String()
+
+    note = graphene.Field(Note)
+
+    @staticmethod
+    def mutate(parent, info, **fields):
+        return AddNote(note=_add("note", fields, _user(info)))
+
+
+class EditTask(graphene.Mutation):
+    """
+    Change some fields of a task. `rev` is the revision being edited;
+    the edit fails if the task has been changed since.
+    """
+
+    class Arguments:
+        id = graphene.ID(required=True)
+        rev = graphene.Int(required=True)
+        subject = graphene.String()
+        date = graphene.String()
+        tags = graphene.List(graphene.String)
+        priority = graphene.String()
+        repeat = graphene.String()
+
+    task = graphene.Field(Task)
+
+    @staticmethod
+    def mutate(parent, info, id, rev, **changes):
+        return EditTask(task=_edit("task", id, rev, changes, _user(info).name))
+
+
+class EditNote(graphene.Mutation):
+    """
+    Change some fields of a note. `rev` is the revision being edited;
+    the edit fails if the note has been changed since.
+    """
+
+    class Arguments:
+        id = graphene.ID(required=True)
+        rev = graphene.Int(required=True)
+        subject = graphene.String()
+        date = graphene.String()
+        tags = graphene.List(graphene.String)
+        priority = graphene.String()
+        note = graphene.String()
+
+    note = graphene.Field(Note)
+
+    @staticmethod
+    def mutate(parent, info, id, rev, **changes):
+        return EditNote(note=_edit("note", id, rev, changes, _user(info).name))
+
+
+class CompleteTask(graphene.Mutation):
+    """
+    Mark a task done on `date`, by default on its first
+    occurrence that is not done yet.
+    """
+
+    class Arguments:
+        id = graphene.ID(required=True)
+        date = graphene.String()
+
+    task = graphene.Field(Task)
+
+    @staticmethod
+    def mutate(parent, info, id, date=None):
+        try:
+            document = database.complete_task(_object_id(id), date, _user(info).name)
+        except database.EditConflict as err:
+            raise ValueError(str(err))
+        data = {k: v for k, v in document.items() if k != "_id"}
+        broker.feed.publish_threadsafe("task", "update", document["_id"], data)
+        return CompleteTask(task=document)
+
+
+class Mutation(graphene.ObjectType):
+    add_task = AddTask.Field()
+    add_note = AddNote.Field()
+    edit_task = EditTask.Field()
+    edit_note = EditNote.Field()
+    complete_task = CompleteTask.Field()
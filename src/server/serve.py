@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""
+daisho-server: run the Daisho API with uvicorn.
+
+    ./serve.py --workers 4 --loop uvloop --pool-size 50
+    ./serve.py --store memory --port 8001   # no MongoDB needed
+    ./serve.py --users users.conf           # a server shared by a team
+    ./serve.py --users users.conf --add-user alice
+
+Each worker is a separate process with its own MongoDB client, and so
+its own connection pool. On SIGINT / SIGTERM the workers stop accepting
+connections and finish in-flight requests, for up to
+`--graceful-timeout` seconds, before exiting.
+
+With `--users`, every request needs a user's token, and each user has
+their own tasks and notes, and limits; see tenants.py.
+"""
+
+import argparse
+import os
+import sys
+
+import uvicorn
+
+import tenants
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="daisho-server", description="Daisho API server"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--loop",
+        default="auto",
+        choices=["auto", "asyncio", "uvloop"],
+        help="event loop implementation",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=100,
+        help="MongoDB connections per worker",
+    )
+    parser.add_argument(
+        "--store",
+        default="mongo",
+        choices=["mongo", "memory"],
+        help="`memory` uses an in-process stand-in for MongoDB",
+    )
+    parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=30,
+        help="seconds to wait for in-flight requests on shutdown",
+    )
+    parser.add_argument(
+        "--no-access-log", action="store_true", help="don't log each request"
+    )
+    parser.add_argument(
+        "--users",
+        metavar="FILE",
+        help="the users, their token digests and limits (default: one, anonymous)",
+    )
+    parser.add_argument(
+        "--add-user",
+        metavar="NAME",
+        help="add a user to the --users file, print their token, and exit",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="profiles",
+        metavar="DIR",
+        help="profile each request, writing to DIR (default: ./profiles)",
+    )
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.add_user:
+        if not args.users:
+            parser.error("--add-user needs --users")
+        print(tenants.add_user(args.users, args.add_user))
+        return
+
+    # Workers are started as new processes, which import `main:app`
+    # themselves; pass the settings down through the environment.
+    os.environ["DAISHO_POOL_SIZE"] = str(args.pool_size)
+    os.environ["DAISHO_STORE"] = args.store
+    if args.users:
+        os.environ["DAISHO_USERS"] = os.path.abspath(args.users)
+    if args.profile:
+        os.environ["DAISHO_PROFILE"] = os.path.abspath(args.profile)
+    # The server's modules, and the `db` package it shares with the CLI.
+    sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        access_log=not args.no_access_log,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+"""
+Users, for a Daisho server shared by a team.
+
+With `daisho-server --users FILE` (which sets `DAISHO_USERS`), every
+request must carry `Authorization: Bearer <token>`, and sees only its
+own user's tasks and notes: each stored item has a `tenant` field, and
+every query is scoped to it, on indexes that start with `tenant`.
+Without `--users`, there is a single anonymous user (tenant None) with
+no limits, as before.
+
+FILE is in INI format, with a section per user:
+
+    [alice]
+    token_sha256 = <sha256 hex digest of alice's token>
+    rate = 20           ; requests per second, on average,
+    burst = 40          ; with bursts of up to this many
+    concurrency = 4     ; requests being handled at once
+    max_items = 10000   ; tasks and notes stored
+
+Only `token_sha256` is required. `daisho-server --users FILE
+--add-user NAME` adds a user and prints their token.
+
+Each user's requests are limited by a token bucket (429 when it is
+empty), and at most `concurrency` of them are handled at once; the rest
+wait their turn. So one busy user can hold at most `concurrency` of the
+thread pool's threads and MongoDB connections, and the others' requests
+don't queue behind theirs. The limits are kept by each worker process.
+"""
+
+import asyncio
+import configparser
+import hashlib
+import math
+import secrets
+import time
+
+from starlette.responses import JSONResponse
+
+RATE = 20.0
+BURST = 40
+CONCURRENCY = 4
+MAX_ITEMS = 10000
+
+
+class User(object):
+    def __init__(
+        self,
+        name,
+        rate=RATE,
+        burst=BURST,
+        concurrency=CONCURRENCY,
+        max_items=MAX_ITEMS,
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_items = max_items
+        self.tokens = burst
+        self.updated = time.monotonic()
+        # Created on first use, in the event loop.
+        self.slots = None
+
+    def allow(self):
+        """
+        Take a token from the user's bucket; False if it is empty.
+        Called from the event loop only.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def retry_after(self):
+        return max(1, math.ceil((1 - self.tokens) / self.rate))
+
+    def semaphore(self):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.concurrency)
+        return self.slots
+
+
+# The only user when the server runs without `--users`.
+ANONYMOUS = User(None, max_items=None)
+
+
+class Users(object):
+    def __init__(self, path=None):
+        self.path = path
+        self.by_digest = {}
+        if path:
+            self.load()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def load(self):
+        parser = configparser.ConfigParser()
+        if not parser.read(self.path):
+            raise SystemExit("Can't read the users file {}".format(self.path))
+        for name in parser.sections():
+            section = parser[name]
+            self.by_digest[section["token_sha256"]] = User(
+                name,
+                rate=section.getfloat("rate", RATE),
+                burst=section.getint("burst", BURST),
+                concurrency=section.getint("concurrency", CONCURRENCY),
+                max_items=section.getint("max_items", MAX_ITEMS),
+            )
+
+    def authenticate(self, token):
+        """
+        The user `token` belongs to, or None.
+        """
+        if not token:
+            return None
+        return self.by_digest.get(_digest(token))
+
+
+def add_user(path, name):
+    """
+    Add the user `name` to the users file at `path`,
+    and return their new token.
+    """
+    parser = configparser.ConfigParser()
+    parser.read(path)
+    if parser.has_section(name):
+        raise SystemExit("User `{}` already exists".format(name))
+    token = secrets.token_urlsafe(32)
+    parser.add_section(name)
+    parser.set(name, "token_sha256", _digest(token))
+    with open(path, "w") as users_file:
+        parser.write(users_file)
+    return token
+
+
+def _digest(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TenantMiddleware(object):
+    """
+    Authenticate each request, and apply its user's limits.
+    The user is stored in the scope, as `scope["user"]`.
+    """
+
+    def __init__(self, app, users):
+        self.app = app
+        self.users = users
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        if not self.users.enabled:
+            scope["user"] = ANONYMOUS
+            await self.app(scope, receive, send)
+            return
+
+        user = self.users.authenticate(_token(scope))
+        if user is None:
+            await _reject(scope, receive, send, 401, "Invalid or missing token")
+            return
+        if not user.allow():
+            headers = {"Retry-After": str(user.retry_after())}
+            await _reject(scope, receive, send, 429, "Rate limit exceeded", headers)
+            return
+        scope["user"] = user
+        if scope["type"] == "websocket":
+            # Subscriptions are long lived, and mostly idle.
+            await self.app(scope, receive, send)
+            return
+        async with user.semaphore():
+            await self.app(scope, receive, send)
+
+
+def _token(scope):
+    for name, value in scope.get("headers") or []:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer":
+                return token.strip()
+    # Browsers can't set headers on a WebSocket; allow `?token=`.
+    if scope["type"] == "websocket":
+        for part in scope.get("query_string", b"").decode("latin-1").split("&"):
+            name, _, value = part.partition("=")
+            if name == "token":
+                return value
+    return None
+
+
+async def _reject(scope, receive, send, status, message, headers=None):
+    if scope["type"] == "websocket":
+        # Closing before the handshake is accepted rejects it.
+        await send({"type": "websocket.close", "code": 4000 + status})
+        return
+    response = JSONResponse(
+        {"errors": [{"message": message}]}, status_code=status, headers=headers
+    )
+    await response(scope, receive, send)